@@ -0,0 +1,135 @@
+import pytest
+import mro
+import connection as con
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, name varchar(20) not null)")
+    cursor.execute("create table table2 (id serial primary key, name varchar(20) not null, table1_id integer references table1(id))")
+    for i in range(1, 4):
+        cursor.execute("insert into table1 (name) values (%s)", (f'table1_{i}',))
+    for i in range(1, 7):
+        cursor.execute("insert into table2 (name, table1_id) values (%s, %s)", (f'table2_{i}', i % 3 + 1 if i < 6 else None))
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+
+    return lambda: con.connect()
+
+
+def record_statements(monkeypatch, table_class):
+    statements = []
+    execute_sql = table_class._execute_sql
+    execute_prepared = table_class._execute_prepared
+
+    def record(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    def record_prepared(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_prepared(sql, *args, **kwargs)
+
+    monkeypatch.setattr(table_class, '_execute_sql', record)
+    monkeypatch.setattr(table_class, '_execute_prepared', record_prepared)
+    return statements
+
+
+def test_foreign_keys_loaded_together(connection_function, monkeypatch):
+    with mro.table.batch_loads():
+        tables = mro.table2.select("id < %s", 6)
+
+        statements = record_statements(monkeypatch, mro.table1)
+        names = [table.table1_id.object.name for table in tables]
+
+    assert names == ['table1_2', 'table1_3', 'table1_1', 'table1_2', 'table1_3']
+    assert len(statements) == 1
+    assert tables[0].table1_id.object is tables[3].table1_id.object
+
+
+def test_foreign_keys_queued_once(connection_function, monkeypatch):
+    with mro.table.batch_loads() as loader:
+        tables = mro.table2.select()
+
+        queued = []
+        queue = loader._queue
+        monkeypatch.setattr(loader, '_queue', lambda table_class, key: queued.append(key) or queue(table_class, key))
+        for table in tables:
+            table.table1_id.object
+
+    # the keys from the whole select are queued along with the first row's own key, and not again for the others
+    assert queued == [2, 3, 1, 2, 3, 2]
+
+
+def test_writes_forget_loaded_rows(connection_function):
+    with mro.table.batch_loads():
+        assert mro.table1.get(1).name == 'table1_1'
+        assert mro.table1.get(4) is None
+
+        mro.table2.delete("table1_id = %s", 1)
+        mro.table1.delete("id = %s", 1)
+        mro.table1.insert(id=4, name='table1_4')
+
+        assert mro.table1.get(1) is None
+        assert mro.table1.get(4).name == 'table1_4'
+
+
+def test_foreign_keys_without_batch_loads(connection_function, monkeypatch):
+    tables = mro.table2.select("id < %s", 6)
+
+    statements = record_statements(monkeypatch, mro.table1)
+    names = [table.table1_id.object.name for table in tables]
+
+    assert names == ['table1_2', 'table1_3', 'table1_1', 'table1_2', 'table1_3']
+    assert len(statements) == 5
+
+
+def test_null_foreign_key(connection_function):
+    with mro.table.batch_loads():
+        tables = mro.table2.select()
+        assert tables[5].table1_id.object is None
+        assert tables[0].table1_id.object.name == 'table1_2'
+
+
+def test_queued_gets(connection_function, monkeypatch):
+    statements = record_statements(monkeypatch, mro.table1)
+
+    with mro.table.batch_loads() as loader:
+        pending = [loader.get(mro.table1, i) for i in (3, 1, 7)]
+        assert statements == []
+
+        assert pending[0].object.name == 'table1_3'
+        assert pending[1].object.name == 'table1_1'
+        assert pending[2].object is None
+        assert len(statements) == 1
+
+        # rows already loaded in the block come from the loader
+        assert mro.table1.get(3) is pending[0].object
+        assert len(statements) == 1
+
+        # and get loads anything still queued with its own row
+        queued = loader.get(mro.table1, 2)
+        assert mro.table2.get(1).name == 'table2_1'
+        assert mro.table1.get(2) is queued.object
+        assert len(statements) == 2
+
+
+def test_nested_blocks_share_loader(connection_function):
+    with mro.table.batch_loads() as loader:
+        with mro.table.batch_loads() as inner_loader:
+            assert inner_loader is loader
+        assert mro.table.table._loader.loader is loader
+    assert mro.table.table._loader.loader is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,91 @@
+import importlib.util
+import pytest
+import mro
+import mro.codegen
+import connection as con
+from datetime import date
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+    cursor.execute("DROP TYPE IF EXISTS custom_type")
+    cursor.execute("CREATE TYPE custom_type AS (custom_field_1 float, custom_field_2 integer)")
+    cursor.execute("""create table table1 (
+    id serial primary key,
+    created_date date not null default current_date,
+    column1 integer default 1,
+    column2 varchar(20) default 'ABC',
+    column3 custom_type,
+    "column 4" integer)""")
+    cursor.execute("create table table2 (id serial primary key, table1_id integer references table1(id))")
+    cursor.execute('create table "table 3" (id serial primary key, value integer)')
+    cursor.execute("create function add_one(value integer) returns integer language sql as $$ select value + 1 $$")
+    cursor.execute("insert into table1 (column1, column3) values (%s, %s)", (5, (1.5, 2)))
+    cursor.execute("insert into table2 (table1_id) values (1)")
+    cursor.execute('insert into "table 3" (value) values (3)')
+    connection.commit()
+    connection.close()
+
+    return lambda: con.connect()
+
+
+def generate_module(tmp_path):
+    output_file = str(tmp_path / 'generated_schema.py')
+    connection = con.connect()
+    mro.codegen.generate(connection, output_file)
+    connection.close()
+
+    spec = importlib.util.spec_from_file_location('generated_schema', output_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_generated_module(connection_function, tmp_path, monkeypatch):
+    schema_module = generate_module(tmp_path)
+
+    def fail(connection):
+        raise Exception('The schema should have come from the generated module')
+
+    monkeypatch.setattr(mro, '_introspect_schema', fail)
+    mro.load_database(connection_function, schema_module=schema_module)
+
+    table = mro.table1.select_one()
+    assert table.column1 == 5
+    assert isinstance(table.created_date, date)
+    assert isinstance(table.column3, mro.custom_types.custom_type)
+    assert table.column3.custom_field_2 == 2
+    assert getattr(table, 'column 4') is None
+
+    table = mro.table1(column1=7, column3={'custom_field_1': 2.5, 'custom_field_2': 3})
+    assert table.column2 == 'ABC'
+    assert isinstance(table.id, int)
+    table.column1 = 8
+    assert mro.table1.select_one('id = %s', table.id).column1 == 8
+
+    table2 = mro.table2.select_one()
+    assert isinstance(table2.table1_id.object, mro.table1)
+    assert len(table2.table1_id.object.table2s) == 1
+
+    assert getattr(mro, 'table 3').select_one().value == 3
+    assert mro.add_one(1) == 2
+
+
+def test_command_line(connection_function, tmp_path):
+    output_file = str(tmp_path / 'generated_schema.py')
+    mro.codegen.main(['connection:get_connection', output_file])
+
+    with open(output_file) as f:
+        source = f.read()
+    compile(source, output_file, 'exec')
+    assert 'class table1(mro.table.table):' in source
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -27,7 +27,7 @@ def drop_tables():
 
     for table in cursor:
         cursor2 = connection.cursor()
-        cursor2.execute("drop table " + table[2] + " cascade;")
+        cursor2.execute("drop table \"" + table[2] + "\" cascade;")
     connection.commit()
 
     # clear stored procs and functions
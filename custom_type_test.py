@@ -36,6 +36,26 @@ def connection_function(request):
     return lambda: con.connect()
 
 
+@pytest.fixture
+def enum_connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+    cursor.execute("""DROP TYPE IF EXISTS custom_enum""")
+    cursor.execute("""CREATE TYPE custom_enum AS ENUM ('small', 'medium', 'large')""")
+    cursor.execute("create table table1 (id serial primary key,"
+                                        "column1 custom_enum not null default 'medium',"
+                                        "column2 custom_enum)")
+    cursor.execute("insert into table1 (column1, column2) values (%s, %s)", ('small', 'large'))
+    connection.commit()
+    connection.close()
+
+    return lambda: con.connect()
+
+
 class TestTable(object):
     def test_table_reflection(self, connection_function):
         mro.load_database(connection_function)
@@ -248,6 +268,28 @@ class TestTable(object):
 
         assert len(mro.table1.select()) == 3
 
+    def test_select_after_reconnect(self, connection_function):
+        mro.load_database(connection_function)
+        mro.disconnect()
+        mro.execute_sql('select 1')
+
+        table = mro.table1.select_one('column1 = 1')
+        assert isinstance(table.column3, mro.custom_types.custom_type)
+        assert table.column3.custom_field_1 == 1.2345
+
+    def test_enum_columns(self, enum_connection_function):
+        mro.load_database(enum_connection_function)
+
+        table = mro.table1.select_one()
+        assert table.column1 == 'small'
+        assert table.column2 == 'large'
+
+        table.column2 = 'medium'
+        assert mro.table1.select_one().column2 == 'medium'
+
+        table = mro.table1(column2='small')
+        assert table.column1 == 'medium'
+        assert mro.table1.select_count("column1 = 'medium'") == 1
 
 
 if __name__ == '__main__':
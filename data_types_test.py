@@ -30,6 +30,9 @@ def connection(request):
     # cursor.execute("""DROP TYPE IF EXISTS call_outcome""")
     # cursor.execute("""CREATE TYPE call_outcome AS ENUM ('No Answer', 'Answer Machine', 'Hung Up', 'Busy', 'Sale')""")
 
+    cursor.execute("drop domain if exists short_text")
+    cursor.execute("create domain short_text as varchar(10)")
+
     cursor.execute("""create table test_type (
     id serial primary key,
     "varchar" varchar(15), 
@@ -47,7 +50,9 @@ def connection(request):
     "real" real,
     "uuid" uuid,
     "bytea" bytea,
-    "oid" oid);""")
+    "oid" oid,
+    "short_text" short_text,
+    "generated" integer generated always as ("integer" * 2) stored);""")
     # "custom_enum" call_outcome);""")
     connection.commit()
     connection.close()
@@ -243,6 +248,20 @@ class TestDataTypes(object):
             obj.oid = 'randomstring'
         assert excinfo.value.args[0] == 'Value should be of type [int] not [{}]'.format(str.__name__)
 
+    def test_domain(self, connection):
+        obj = mro.test_type(varchar='init')
+
+        obj.short_text = 'short'
+        assert obj.short_text == 'short'
+        with pytest.raises(ValueError) as excinfo:
+            obj.short_text = 'far too long'
+        assert excinfo.value.args[0] == 'Value length [12] should not exceed [10]'
+
+    def test_generated_column(self, connection):
+        obj = mro.test_type(integer=3)
+
+        assert mro.test_type.select_one("id = %s", obj.id).generated == 6
+
 
 if __name__ == '__main__':
     #pytest.main([__file__, '-rw'])
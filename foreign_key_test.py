@@ -169,6 +169,17 @@ class TestForeignKeys(object):
         serialised = json.dumps({"foreign_key": table2.table1_id, "foreign_key2": table3.table1_id})
         assert serialised == '{"foreign_key": 1, "foreign_key2": null}' or serialised == '{"foreign_key2": null, "foreign_key": 1}'
 
+    def test_foreign_keys_parallel_introspection(self, connection):
+        mro.load_database(lambda: con.connect(), introspection_workers=4)
+
+        table2 = mro.table2.select_one('table1_id is not null')
+        assert isinstance(table2.table1_id.object, mro.table1)
+        assert len(table2.table1_id.object.table2s) > 0
+        assert table2.table1_id.object.id == table2.table1_id.value
+
+        assert isinstance(mro.table3.__dict__['table4s'], mro.data_types.varchar)
+        assert isinstance(mro.table4.__dict__['table3_id'], mro.foreign_keys.foreign_key_data_type)
+
 if __name__ == '__main__':
     #pytest.main([__file__])
     #pytest.main([__file__ + '::TestForeignKeys::test_foreign_keys_shortcuts'])
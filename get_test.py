@@ -0,0 +1,169 @@
+import pytest
+import mro
+import connection as con
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, name varchar(20) not null)")
+    cursor.execute("create table table2 (id serial primary key, name varchar(20) not null, table1_id integer references table1(id))")
+    cursor.execute("create table table3 (a integer, b varchar(20), name varchar(20), primary key (a, b))")
+    cursor.execute("create table table4 (name varchar(20))")
+    cursor.execute("insert into table1 (name) values ('table1_1')")
+    cursor.execute("insert into table1 (name) values ('table1_2')")
+    cursor.execute("insert into table2 (name, table1_id) values ('table2_1', 2)")
+    cursor.execute("insert into table3 (a, b, name) values (1, 'x', 'table3_1')")
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+
+    return lambda: con.connect()
+
+
+def prepared_statement_count():
+    cursor = mro.connection.connection.cursor()
+    cursor.execute("select count(*) from pg_prepared_statements")
+    count = cursor.fetchone()[0]
+    mro.connection.connection.commit()
+    return count
+
+
+def test_get(connection_function):
+    table = mro.table1.get(2)
+    assert table.id == 2
+    assert table.name == 'table1_2'
+    assert mro.table1.get(1).name == 'table1_1'
+    assert mro.table1.get(3) is None
+
+    # the statement is only prepared once
+    assert prepared_statement_count() == 1
+
+
+def test_get_composite_key(connection_function):
+    assert mro.table3.get(1, 'x').name == 'table3_1'
+    assert mro.table3.get(1, 'y') is None
+
+    with pytest.raises(ValueError):
+        mro.table3.get(1)
+
+
+def test_get_without_primary_key(connection_function):
+    with pytest.raises(ValueError):
+        mro.table4.get('table4_1')
+
+
+def test_get_after_reconnect(connection_function):
+    assert mro.table1.get(1).name == 'table1_1'
+
+    mro.connection.connection.close()
+    mro.connection.reconnect()
+    assert prepared_statement_count() == 0
+
+    assert mro.table1.get(1).name == 'table1_1'
+    assert prepared_statement_count() == 1
+
+
+def test_get_after_statements_discarded(connection_function):
+    assert mro.table1.get(1).name == 'table1_1'
+
+    cursor = mro.connection.connection.cursor()
+    cursor.execute("deallocate all")
+    mro.connection.connection.commit()
+
+    assert mro.table1.get(1).name == 'table1_1'
+
+
+def test_get_after_table_changed(connection_function):
+    assert mro.table1.get(1).name == 'table1_1'
+
+    connection = con.connect()
+    connection.cursor().execute("alter table table1 add column value integer")
+    connection.commit()
+
+    assert mro.table1.get(1).name == 'table1_1'
+
+    # a change to the type of a column selected means the statement has to be prepared again
+    connection.cursor().execute("alter table table1 alter column name type text")
+    connection.commit()
+    connection.close()
+
+    assert mro.table1.get(1).name == 'table1_1'
+
+
+def test_get_uses_identity_map(connection_function):
+    with mro.table.identity_map():
+        table = mro.table1.select_one("id = %s", 1)
+        assert mro.table1.get(1) is table
+        assert mro.table2.select_one().table1_id.object is mro.table1.get(2)
+
+
+def test_foreign_key_uses_get(connection_function):
+    table2 = mro.table2.select_one()
+    assert table2.table1_id.object.name == 'table1_2'
+    assert prepared_statement_count() == 1
+
+
+def test_get_with_foreign_key(connection_function):
+    table2 = mro.table2.select_one()
+    assert mro.table1.get(table2.table1_id).name == 'table1_2'
+
+
+def test_get_many(connection_function):
+    tables = mro.table1.get_many([2, 3, 1, 2])
+    assert [t.name if t else None for t in tables] == ['table1_2', None, 'table1_1', 'table1_2']
+    assert tables[0] is tables[3]
+
+    assert mro.table1.get_many([]) == []
+    assert mro.table1.get_many([None, 1])[0] is None
+
+
+def test_get_many_batches(connection_function):
+    tables = mro.table1.get_many(range(1, 6), batch_size=2)
+    assert [t.id if t else None for t in tables] == [1, 2, None, None, None]
+
+
+def test_get_many_composite_key(connection_function):
+    tables = mro.table3.get_many([(1, 'y'), (1, 'x')])
+    assert tables[0] is None
+    assert tables[1].name == 'table3_1'
+
+
+def test_get_many_by_column(connection_function):
+    tables = mro.table1.get_many(['table1_2', 'missing', 'table1_1'], column='name')
+    assert [t.id if t else None for t in tables] == [2, None, 1]
+
+    table2 = mro.table2.select_one()
+    assert mro.table2.get_many([table2.table1_id], column='table1_id')[0].name == 'table2_1'
+
+    with pytest.raises(ValueError):
+        mro.table1.get_many(['table1_1'], column='not_a_column')
+
+    with pytest.raises(ValueError):
+        mro.table4.get_many(['table4_1'])
+
+
+def test_get_many_deferred_key_column(connection_function):
+    mro.table1.set_deferred_columns('name')
+
+    tables = mro.table1.get_many(['table1_1'], column='name')
+    assert tables[0].id == 1
+
+
+def test_get_many_uses_identity_map(connection_function):
+    with mro.table.identity_map():
+        table = mro.table1.select_one("id = %s", 1)
+        tables = mro.table1.get_many([1, 2])
+        assert tables[0] is table
+        assert tables[1] is mro.table1.get(2)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,56 @@
+import time
+import mro
+import connection as con
+
+
+ROW_COUNT = 100000
+
+
+def select_through_init(cls):
+    # How select built its objects before rows were hydrated directly
+    cursor = cls._execute_sql("select * from \"{}\";".format(cls.__name__))
+    column_names = [column.name for column in cursor.description]
+    with mro.table.disable_insert():
+        return [cls(**dict(zip(column_names, row))) for row in cursor]
+
+
+def best_of(function, repeat=5):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    connection = con.connect()
+    cursor = connection.cursor()
+    con.drop_tables()
+    cursor.execute("create table benchmark (id serial primary key, column1 integer, column2 varchar(20), column3 float, column4 boolean, column5 text, column6 timestamp default current_timestamp)")
+    cursor.execute("insert into benchmark (column1, column2, column3, column4, column5) "
+                   "select i, 'name ' || i, i / 3.0, i %% 2 = 0, 'some text' from generate_series(1, %s) i", (ROW_COUNT,))
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+    try:
+        through_init = best_of(lambda: select_through_init(mro.benchmark))
+        hydrated = best_of(lambda: mro.benchmark.select())
+        arrays = best_of(lambda: mro.benchmark.select_arrays())
+        copy_arrays = best_of(lambda: mro.benchmark.copy_out_arrays())
+        query_only = best_of(lambda: mro.benchmark._execute_sql("select * from benchmark;").fetchall())
+    finally:
+        mro.disconnect()
+
+    print(f"{ROW_COUNT} rows")
+    print(f"query only:      {query_only:.3f}s")
+    print(f"through __init__: {through_init:.3f}s ({through_init - query_only:.3f}s building objects)")
+    print(f"hydrated:         {hydrated:.3f}s ({hydrated - query_only:.3f}s building objects)")
+    print(f"select_arrays:    {arrays:.3f}s")
+    print(f"copy_out_arrays:  {copy_arrays:.3f}s")
+    print(f"object building speed up: {(through_init - query_only) / (hydrated - query_only):.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import gc
+import pytest
+import mro
+import connection as con
+from threading import Thread
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, name varchar(20) not null)")
+    cursor.execute("create table table2 (id serial primary key, name varchar(20) not null, table1_id integer references table1(id))")
+    cursor.execute("insert into table1 (name) values ('table1_1')")
+    cursor.execute("insert into table2 (name, table1_id) values ('table2_1', 1)")
+    cursor.execute("insert into table2 (name, table1_id) values ('table2_2', 1)")
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+
+    return lambda: con.connect()
+
+
+def test_same_object_for_same_row(connection_function):
+    assert mro.table1.select_one() is not mro.table1.select_one()
+
+    with mro.table.identity_map():
+        table1 = mro.table1.select_one()
+        assert mro.table1.select_one("id = %s", 1) is table1
+        assert mro.table1.select()[0] is table1
+
+
+def test_existing_object_refreshed(connection_function):
+    with mro.table.identity_map():
+        table1 = mro.table1.select_one()
+
+        connection = con.connect()
+        connection.cursor().execute("update table1 set name = 'changed'")
+        connection.commit()
+        connection.close()
+
+        assert mro.table1.select_one() is table1
+        assert table1.name == 'changed'
+
+
+def test_foreign_key_object_from_memory(connection_function, monkeypatch):
+    with mro.table.identity_map():
+        table1 = mro.table1.select_one()
+        table2s = mro.table2.select()
+
+        def fail(*args, **kwargs):
+            raise Exception('The referenced object should have come from the identity map')
+
+        monkeypatch.setattr(mro.table1, 'select_one', fail)
+
+        assert table2s[0].table1_id.object is table1
+        assert table2s[1].table1_id.object is table1
+
+
+def test_objects_not_kept_alive(connection_function):
+    with mro.table.identity_map() as identity_map:
+        mro.table2.select()
+        gc.collect()
+
+        assert len(identity_map) == 0
+
+
+def test_deleted_object_removed(connection_function):
+    with mro.table.identity_map() as identity_map:
+        table2 = mro.table2.select_one("id = %s", 2)
+        table2.delete()
+
+        assert (mro.table2, (2,)) not in identity_map
+
+
+def test_table_writes_clear_identity_map(connection_function):
+    with mro.table.identity_map():
+        table1 = mro.table1.get(1)
+        mro.table1.update(['id'], [1], name='changed')
+        assert mro.table1.get(1) is not table1
+        assert mro.table1.get(1).name == 'changed'
+
+        table2 = mro.table2.get(1)
+        mro.table2.delete("id = %s", 1)
+        assert mro.table2.get(1) is None
+
+        # a row's own writes keep it
+        table2 = mro.table2.get(2)
+        table2.name = 'renamed'
+        assert mro.table2.get(2) is table2
+
+
+def test_identity_map_per_thread(connection_function):
+    objects = []
+
+    with mro.table.identity_map():
+        table1 = mro.table1.select_one()
+
+        thread = Thread(target=lambda: objects.append(mro.table1.select_one()))
+        thread.start()
+        thread.join()
+
+        assert objects[0] is not table1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
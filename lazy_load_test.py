@@ -0,0 +1,107 @@
+import pytest
+import psycopg2.errors
+import mro
+import connection as con
+from threading import Thread
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, name varchar(20) not null)")
+    cursor.execute("create table table2 (id serial primary key, name varchar(20) not null, table1_id integer references table1(id))")
+    cursor.execute("insert into table1 (name) values ('table1_1')")
+    cursor.execute("insert into table2 (name, table1_id) values ('table2_1', 1)")
+    cursor.execute("insert into table2 (name, table1_id) values ('table2_2', 1)")
+    connection.commit()
+    connection.close()
+
+    return lambda: con.connect()
+
+
+def test_tables_built_on_first_access(connection_function):
+    mro.load_database(connection_function, lazy=True)
+
+    assert 'table1' not in mro.__dict__
+    assert 'table1' in dir(mro)
+
+    table = mro.table1.select_one()
+
+    assert 'table1' in mro.__dict__
+    assert 'table2' not in mro.__dict__
+    assert table.name == 'table1_1'
+
+
+def test_lazy_foreign_keys(connection_function):
+    mro.load_database(connection_function, lazy=True)
+
+    table2 = mro.table2.select_one()
+    assert isinstance(table2.table1_id.object, mro.table1)
+    assert table2.table1_id.object.name == 'table1_1'
+
+    mro.load_database(connection_function, lazy=True)
+
+    table1 = mro.table1.select_one()
+    assert len(table1.table2s) == 2
+
+
+def test_lazy_unknown_attribute(connection_function):
+    mro.load_database(connection_function, lazy=True)
+
+    with pytest.raises(AttributeError):
+        mro.table5
+
+
+def test_lazy_concurrent_access(connection_function):
+    mro.load_database(connection_function, lazy=True)
+
+    classes = []
+    threads = [Thread(target=lambda: classes.append(mro.table1)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(classes) == 10
+    assert all(c is classes[0] for c in classes)
+
+
+def test_lazy_with_schema_cache(connection_function, tmp_path):
+    cache_file = str(tmp_path / 'schema.json')
+    mro.load_database(connection_function, schema_cache_file=cache_file, lazy=True)
+    mro.load_database(connection_function, schema_cache_file=cache_file, lazy=True)
+
+    assert 'table2' not in mro.__dict__
+    assert mro.table2.select_count() == 2
+
+
+def test_lazy_table_after_connection_lost(connection_function):
+    mro.load_database(connection_function, lazy=True)
+
+    mro.connection.connection.close()
+
+    assert mro.table1.select_one().name == 'table1_1'
+
+
+def test_lazy_table_failure_rolled_back(connection_function, monkeypatch):
+    mro.load_database(connection_function, lazy=True)
+
+    def fail(connection, table_names=None):
+        connection.cursor().execute("select 1 / 0")
+
+    monkeypatch.setattr(mro, '_load_standard_db', fail)
+    with pytest.raises(psycopg2.errors.DivisionByZero):
+        mro.table1
+    monkeypatch.undo()
+
+    assert mro.table1.select_one().name == 'table1_1'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -4,229 +4,531 @@ import mro.table
 import mro.sqlite
 import mro.custom_types
 import mro.routine
-import types
+import mro.schema_cache
+import mro.schema_refresh
+import concurrent.futures
+import math
+import threading
+import time
+import psycopg2
 
 
 def disconnect():
+    mro.schema_refresh.stop_listening()
     mro.connection.disconnect()
 
 
-def load_database(connection_function, hooks=None):
+_schema_cache_file = None
+_check_schema_on_reconnect = False
+_schema_fingerprint = None
+_introspection_workers = 1
+_schema_module = None
+_lazy = False
+# table name -> table data (or None if it still needs introspecting) for tables not yet built in lazy mode
+_lazy_tables = {}
+_lazy_lock = threading.Lock()
+# table name -> the class being replaced by a schema reload, until the new class is built and given its settings
+_previous_classes = {}
+
+
+def __getattr__(name):
+    # Only called when normal module attribute lookup fails, which in lazy mode is how we find out a table is wanted
+    if name not in _lazy_tables:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    with _lazy_lock:
+        if name not in globals():
+            _materialise_table(name)
+    return globals()[name]
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_tables))
+
+
+def load_database(connection_function, hooks=None, schema_cache_file=None, lazy=False,
+                  check_schema_on_reconnect=False, introspection_workers=1, listen_for_schema_changes=False,
+                  schema_module=None):
+    global _schema_cache_file
+    global _check_schema_on_reconnect
+    global _introspection_workers
+    global _schema_module
+    global _lazy
     print("***********INITIALISING DATABASE************")
+    _schema_cache_file = schema_cache_file
+    _check_schema_on_reconnect = check_schema_on_reconnect
+    _introspection_workers = introspection_workers
+    _schema_module = schema_module
+    _lazy = lazy
+    # Stop any listener from the last load first so it can't swap in classes from the old database part way through
+    mro.schema_refresh.stop_listening()
+    _previous_classes.clear()
     mro.connection.set_connection_function(connection_function)
-    mro.connection.set_on_reconnect(init_db)
+    mro.connection.set_on_reconnect(_on_reconnect)
     mro.connection.set_hooks(hooks)
     connection = mro.connection.connection
     init_db(connection)
+    if listen_for_schema_changes:
+        mro.schema_refresh.start_listening(connection_function, _refresh_schema)
     if hooks is not None:
         for hook in hooks:
             hook()
 
 
 def init_db(connection):
+    global _schema_fingerprint
     if connection.__class__.__module__ == 'sqlite3':
         tables = sqlite._load_sqllite_db(connection)
-    else:
-        tables = _load_standard_db(connection)
+        _create_classes(tables)
+        return
+
+    # Take the fingerprint before introspecting so a change made part way through is picked up next time
+    if _schema_cache_file is not None or _check_schema_on_reconnect:
+        _schema_fingerprint = mro.schema_cache.get_fingerprint(connection)
+
+    if _schema_module is not None:
+        _create_schema_from_module(connection, _schema_module)
+        return
 
-    _create_classes(tables)
+    schema = _get_schema(connection)
+    _create_schema(connection, schema)
+
+
+def _create_schema(connection, schema):
+    print('Creating custom types')
+    mro.custom_types.create_custom_types(connection, schema['custom_types'])
+
+    _set_lazy_tables(schema['tables'] if _lazy else {})
+    if not _lazy:
+        _create_classes(schema['tables'])
+
+    mro.routine._create_routines(schema['routines'])
+    for table_name in set(_previous_classes) - set(schema['tables']):
+        del _previous_classes[table_name]
+
+
+def _create_schema_from_module(connection, schema_module):
+    # The module was written by mro.codegen so apart from the custom type oids there is nothing to read from the catalog
+    custom_types = schema_module.custom_types
+    if custom_types:
+        custom_types = mro.custom_types._get_custom_type_oids(connection, custom_types)
+    print('Creating custom types')
+    mro.custom_types.create_custom_types(connection, custom_types)
 
-    mro.routine._create_routines(connection)
+    _set_lazy_tables({})
+    for table_class in schema_module.create_classes():
+        table_class._register()
+        _publish_table_class(table_class)
+    _previous_classes.clear()
+
+    mro.routine._create_routines(schema_module.routines)
 
 
 def execute_sql(sql, values=None):
     return mro.table.table._execute_sql(sql, values)
 
 
-def _load_standard_db(connection):
-    print('Loading standard db')
+def _on_reconnect(connection):
+    # The classes and routines don't depend on the connection so unless the schema has changed
+    # only the state held against the connection needs restoring
+    if connection.__class__.__module__ == 'sqlite3':
+        _keep_table_settings()
+        init_db(connection)
+    elif _check_schema_on_reconnect and mro.schema_cache.get_fingerprint(connection) != _schema_fingerprint:
+        print('Schema has changed, reloading database')
+        _keep_table_settings()
+        init_db(connection)
+    else:
+        mro.custom_types.register_custom_types(connection)
+
+
+def _refresh_schema(connection, changes):
+    # Called by the schema listener with its own connection and the objects changed by some DDL. The catalog is read
+    # first, then the classes, custom types and routines are swapped while holding both locks, so no other thread
+    # builds a lazy table or runs a query against the shared connection part way through the swap.
+    changes = [change for change in changes if change['schema'] == 'public']
+    table_names = {change['name'] for change in changes if change['object_type'] in ('table', 'view', 'foreign table')}
+    routine_changed = any(change['object_type'] in ('function', 'procedure') for change in changes)
+    # Dropping a table also drops its row and array types, so only count drops of types we know are custom types
+    type_changed = any(change['object_type'] in ('type', 'composite type')
+                       and (change['name'] in mro.custom_types._custom_type_names or not change['dropped'])
+                       for change in changes)
+
+    if type_changed:
+        # Table classes hold on to the custom type classes so changing a type means rebuilding everything
+        print('Custom types changed, reloading database')
+        schema = _get_lazy_schema(connection) if _lazy else _introspect_schema(connection)
+        with _lazy_lock, mro.table.psycopg2_lock:
+            _keep_table_settings()
+            _create_schema(mro.connection.connection, schema)
+        return
+
+    if table_names:
+        print(f'Tables changed, reloading {sorted(table_names)}')
+        _refresh_tables(connection, table_names)
+    if routine_changed:
+        print('Routines changed, reloading routines')
+        _refresh_routines(connection)
+
+
+def _refresh_tables(connection, table_names):
+    # Tables linked by foreign keys hold references to each other's classes, so they are rebuilt too
+    related_table_names = set(table_names)
+    for table_name in table_names:
+        table_class = globals().get(table_name)
+        if isinstance(table_class, type) and issubclass(table_class, mro.table.table):
+            related_table_names.update(_get_related_table_names(table_class))
+    for table_data in _load_standard_db(connection, list(table_names)).values():
+        related_table_names.update(column['foreign_key'][0] for column in table_data['columns']
+                                   if column.get('foreign_key') is not None)
+        related_table_names.update(target[0] for target in table_data['foreign_key_targets'])
+
+    tables = _load_standard_db(connection, list(related_table_names))
+
+    with _lazy_lock, mro.table.psycopg2_lock:
+        _keep_table_settings(related_table_names)
+        for table_name in related_table_names - set(tables):
+            _lazy_tables.pop(table_name, None)
+            _previous_classes.pop(table_name, None)
+            table_class = globals().get(table_name)
+            if isinstance(table_class, type) and issubclass(table_class, mro.table.table):
+                del globals()[table_name]
+
+        for table_name, table_data in tables.items():
+            if _lazy:
+                _lazy_tables[table_name] = table_data
+                if table_name not in globals():
+                    continue
+            _create_classes({table_name: table_data})
+
+
+def _get_related_table_names(table_class):
+    table_names = set()
+    for value in table_class.__dict__.values():
+        if isinstance(value, mro.foreign_keys.foreign_key_data_type):
+            related_class = value.reference_class
+        elif isinstance(value, mro.foreign_keys.foreign_key_reference):
+            related_class = value.referring_class
+        else:
+            continue
+        table_names.add(related_class.split('.')[-1] if isinstance(related_class, str) else related_class.__name__)
+    return table_names
+
+
+def _refresh_routines(connection):
+    routines = mro.routine._get_routines(connection)
+    routine_names = {routine['name'] for routine in routines}
+    with _lazy_lock, mro.table.psycopg2_lock:
+        for name, value in list(globals().items()):
+            if isinstance(value, mro.routine.Routine) and name not in routine_names:
+                del globals()[name]
+        mro.routine._create_routines(routines)
+
+
+def _keep_table_settings(table_names=None):
+    # Remembers the built classes about to be replaced so the new ones can be given the same settings,
+    # see mro.table.table._copy_settings. Lazy tables not built again yet are given them when they are.
+    for table_name, value in list(globals().items()):
+        if ((table_names is None or table_name in table_names)
+                and isinstance(value, type) and issubclass(value, mro.table.table)):
+            _previous_classes[table_name] = value
+
+
+def _publish_table_class(table_class):
+    previous_class = _previous_classes.pop(table_class.__name__, None)
+    if previous_class is not None:
+        table_class._copy_settings(previous_class)
+    setattr(mro, table_class.__name__, table_class)
+
+
+def _get_schema(connection):
+    if _schema_cache_file is None:
+        return _get_lazy_schema(connection) if _lazy else _introspect_schema(connection)
+
+    schema = mro.schema_cache.read(_schema_cache_file, _schema_fingerprint)
+    if schema is None:
+        schema = _introspect_schema(connection)
+        mro.schema_cache.write(_schema_cache_file, _schema_fingerprint, schema)
+    else:
+        print(f'Loaded schema from cache [{_schema_cache_file}]')
+    return schema
+
+
+def _introspect_schema(connection):
+    if _introspection_workers > 1:
+        return _introspect_schema_parallel(connection)
+    return {'custom_types': mro.custom_types._get_custom_types(connection),
+            'tables': _load_standard_db(connection),
+            'routines': mro.routine._get_routines(connection)}
+
+
+def _introspect_schema_parallel(connection):
+    # Split the tables into one chunk per worker and introspect each chunk, the custom types and the routines
+    # on their own connections. The catalog queries don't hold the GIL while waiting so threads are enough.
+    table_names = _get_table_names(connection)
+    chunk_size = max(1, math.ceil(len(table_names) / _introspection_workers))
+    chunks = [table_names[i:i + chunk_size] for i in range(0, len(table_names), chunk_size)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_introspection_workers) as executor:
+        custom_types = executor.submit(_run_on_new_connection, mro.custom_types._get_custom_types)
+        routines = executor.submit(_run_on_new_connection, mro.routine._get_routines)
+        table_chunks = [executor.submit(_run_on_new_connection, _load_standard_db, chunk) for chunk in chunks]
+
+        tables = {}
+        for table_chunk in table_chunks:
+            tables.update(table_chunk.result())
+
+        return {'custom_types': custom_types.result(),
+                'tables': tables,
+                'routines': routines.result()}
+
+
+def _run_on_new_connection(function, *args):
+    connection = mro.connection.connection_function()
+    try:
+        return function(connection, *args)
+    finally:
+        connection.close()
+
+
+def _get_lazy_schema(connection):
+    # Only the table names are read up front, the tables themselves are introspected on first use
+    return {'custom_types': mro.custom_types._get_custom_types(connection),
+            'tables': dict.fromkeys(_get_table_names(connection)),
+            'routines': mro.routine._get_routines(connection)}
+
+
+def _set_lazy_tables(tables):
+    global _lazy_tables
+    # Forget any classes built from a previous load so they are rebuilt against the current schema
+    for table_name in set(_lazy_tables) | set(tables):
+        table_class = globals().get(table_name)
+        if isinstance(table_class, type) and issubclass(table_class, mro.table.table):
+            del globals()[table_name]
+    _lazy_tables = tables
+
+
+def _materialise_table(table_name):
+    table_data = _lazy_tables[table_name]
+    if table_data is None:
+        table_data = _load_lazy_table(table_name)
+    _create_classes({table_name: table_data})
+
+
+def _load_lazy_table(table_name):
+    # Uses the shared connection so it needs the same reconnect and rollback handling as mro.table._execute_sql
+    with mro.table.psycopg2_lock:
+        retry_count = 0
+        while True:
+            try:
+                return _load_standard_db(mro.connection.connection, [table_name])[table_name]
+            except psycopg2.InterfaceError:
+                if retry_count == mro.table.MAX_ATTEMPTS:
+                    raise
+                mro.table.logger.exception(f"Connection failure loading table [{table_name}], will attempt to reconnect.")
+                time.sleep(retry_count * 1)
+                mro.connection.reconnect()
+            except Exception:
+                try:
+                    mro.connection.connection.rollback()
+                except psycopg2.InterfaceError:
+                    mro.table.logger.exception(f"Connection failure on attempt to rollback loading table [{table_name}]")
+                raise
+            retry_count += 1
+
+
+def _get_table_names(connection):
     cursor = connection.cursor()
+    cursor.execute("""
+        select c.relname
+        from pg_catalog.pg_class c
+        where
+                c.relnamespace = 'public'::regnamespace
+            and c.relkind in ('r', 'p', 'v', 'f')
+        order by c.relname;
+    """)
+    connection.commit()
+    return [row[0] for row in cursor]
 
-    tables = {}
 
-    # Create any custom types
-    print('Creating custom types')
-    mro.custom_types.create_custom_types(connection)
+def _load_standard_db(connection, table_names=None):
+    print('Loading standard db')
 
-    # Get tables
     print('Getting tables')
-    cursor.execute("select * from information_schema.tables where table_schema='public';")
+    cursor = connection.cursor()
+
+    # Get the columns of every table along with whether they are part of the primary key.
+    # This is the equivalent of information_schema.columns but reading the catalog directly
+    # means we can get everything in one round trip rather than one query per table.
+    cursor.execute("""
+        select
+             c.relname as table_name
+            ,a.attname as column_name
+            ,case
+                when t.typelem <> 0 and t.typlen = -1 then 'ARRAY'
+                when tn.nspname = 'pg_catalog' then pg_catalog.format_type(t.oid, null)
+                else 'USER-DEFINED'
+             end as data_type
+            ,t.typname as udt_name
+            ,a.attnum as ordinal_position
+            ,pg_catalog.pg_get_expr(d.adbin, d.adrelid) as column_default
+            ,not (a.attnotnull or coalesce(dt.typnotnull, false)) as is_nullable
+            ,pg_catalog.pg_column_is_updatable(c.oid, a.attnum, false) as is_updatable
+            ,case
+                when t.oid not in ('varchar'::regtype, 'bpchar'::regtype) then null
+                when dt.typtype = 'd' and dt.typtypmod > 0 then dt.typtypmod - 4
+                when dt.typtype <> 'd' and a.atttypmod > 0 then a.atttypmod - 4
+             end as character_maximum_length
+            ,coalesce(a.attnum = any(i.indkey), false) as is_primary_key
+            ,t.typtype = 'e' as is_enum
+        from pg_catalog.pg_class c
+        join pg_catalog.pg_namespace n on n.oid = c.relnamespace
+        left join pg_catalog.pg_attribute a on a.attrelid = c.oid and a.attnum > 0 and not a.attisdropped
+        left join pg_catalog.pg_type dt on dt.oid = a.atttypid
+        left join pg_catalog.pg_type t on t.oid = case when dt.typtype = 'd' then dt.typbasetype else dt.oid end
+        left join pg_catalog.pg_namespace tn on tn.oid = t.typnamespace
+        -- generated columns keep their expression here too but it isn't a default
+        left join pg_catalog.pg_attrdef d on d.adrelid = c.oid and d.adnum = a.attnum and a.attgenerated = ''
+        left join pg_catalog.pg_index i on i.indrelid = c.oid and i.indisprimary
+        where
+                n.nspname = 'public'
+            and c.relkind in ('r', 'p', 'v', 'f')
+            and (%(table_names)s::text[] is null or c.relname::text = any(%(table_names)s::text[]))
+        order by c.relname, a.attnum;
+    """, {'table_names': table_names})
+
+    tables = {}
+    for column in cursor:
+        table_name = column[0]
+        if table_name not in tables:
+            tables[table_name] = {'columns': [], 'foreign_key_targets': []}
+        # tables without any columns still get a class
+        if column[1] is not None:
+            tables[table_name]['columns'].append(_create_column_data(*column[1:]))
+
+    # Get foreign keys in both directions for every table in one go
+    # https://dba.stackexchange.com/a/218969
+    cursor.execute("""
+        select
+             tbl.relname
+            ,col.attname
+            ,ftbl.relname
+            ,fcol.attname
+        from pg_catalog.pg_constraint con
+        join lateral unnest(con.conkey, con.confkey) as u(attnum, fattnum) on true
+        join pg_catalog.pg_class tbl on tbl.oid = con.conrelid
+        join pg_catalog.pg_attribute col on (col.attrelid = tbl.oid and col.attnum = u.attnum)
+        join pg_catalog.pg_class ftbl on ftbl.oid = con.confrelid
+        join pg_catalog.pg_attribute fcol on (fcol.attrelid = ftbl.oid and fcol.attnum = u.fattnum)
+        where
+                con.contype = 'f'
+            and (tbl.relnamespace = 'public'::regnamespace or ftbl.relnamespace = 'public'::regnamespace)
+            and (%(table_names)s::text[] is null
+                 or tbl.relname::text = any(%(table_names)s::text[])
+                 or ftbl.relname::text = any(%(table_names)s::text[]))
+        order by tbl.relname, col.attnum;
+    """, {'table_names': table_names})
     connection.commit()
 
-    for table in cursor:
-        table_name = table[2]
-        print(f'Getting info about table [{table_name}]')
-
-        cursor2 = connection.cursor()
-
-        # Get foreign keys (part 1)
-        # https://dba.stackexchange.com/a/218969
-        cursor2.execute(f"""
-            select 
-                 col.attname as fk_column_name
-                ,ftbl.relname as referenced_table_name
-                ,fcol.attname as referenced_column_name
-            from pg_catalog.pg_constraint con
-            join lateral unnest(con.conkey) with ordinality as u(attnum, attposition) on true
-            join pg_class tbl on tbl.oid = con.conrelid
-            join pg_attribute col on (col.attrelid = tbl.oid and col.attnum = u.attnum)
-            join lateral unnest(con.confkey) with ordinality as fu(attnum, attposition) on true
-            join pg_class ftbl on ftbl.oid = con.confrelid
-            join pg_attribute fcol on (fcol.attrelid = ftbl.oid and fcol.attnum = fu.attnum)
-            where 
-                    con.conrelid = '{table_name}'::regclass 
-                and con.contype = 'f';
-        """)
-        connection.commit()
-
-        foreign_keys = {}
-        for foreign_key in cursor2:
-            foreign_keys[foreign_key[0]] = (foreign_key[1], foreign_key[2])
-
-        # Get foreign keys (part 2)
-        # https://dba.stackexchange.com/a/218969
-        cursor2.execute(f"""
-            select 
-                 tbl.relname
-                ,col.attname
-                ,fcol.attname
-            from pg_catalog.pg_constraint con
-            join lateral unnest(con.conkey) with ordinality as u(attnum, attposition) on true
-            join pg_class tbl on tbl.oid = con.conrelid
-            join pg_attribute col on (col.attrelid = tbl.oid and col.attnum = u.attnum)
-            join lateral unnest(con.confkey) with ordinality as fu(attnum, attposition) on true
-            join pg_class ftbl on ftbl.oid = con.confrelid
-            join pg_attribute fcol on (fcol.attrelid = ftbl.oid and fcol.attnum = fu.attnum)
-            where 
-                    con.confrelid = '{table_name}'::regclass 
-                and con.contype = 'f';        
-        """)
-        connection.commit()
-
-        foreign_key_targets = []
-        for foreign_key in cursor2:
-            foreign_key_targets.append((foreign_key[0], foreign_key[1], foreign_key[2]))
-
-        # Get primary keys
-        # https://wiki.postgresql.org/wiki/Retrieve_primary_key_columns
-        cursor2.execute(f"""
-            select
-                a.attname
-            from pg_index i
-            join pg_attribute a on a.attrelid = i.indrelid and a.attnum = any(i.indkey)
-            where  
-                    i.indrelid = '{table_name}'::regclass
-                and i.indisprimary;        
-        """)
-        connection.commit()
-        primary_key_columns = [row[0] for row in cursor2]
-
-        # Get columns
-        cursor2.execute(f"""
-            select
-                 column_name
-                ,data_type
-                ,udt_name
-                ,ordinal_position
-                ,column_default
-                ,is_nullable
-                ,is_updatable
-                ,character_maximum_length
-            from information_schema.columns 
-            where 
-                    table_name='{table_name}';
-            """)
-        connection.commit()
-
-        columns = []
-        for column in cursor2:
-            col_data = {}
-            column_name = column[0]
-            postgres_type = column[1]
-            if postgres_type == 'USER-DEFINED':
-                postgres_type = column[2]
-                data_type = mro.data_types.type_map[postgres_type]
-                col_data['custom_type'] = eval(f'mro.custom_types.{postgres_type}')
-            else:
-                data_type = mro.data_types.type_map[postgres_type]
-            column_index = column[3]-1
-            column_default = column[4]
-            is_nullable = column[5] == 'YES'
-            is_updateable = column[6] == 'YES'
-            get_value_on_insert = False
-            is_primary_key = column_name in primary_key_columns
-
-            if column_default:
-                column_default, get_value_on_insert = data_type[2](column_default, postgres_type)
-
-            col_data['data_type'] = data_type[0]
-            col_data['column_name'] = column_name
-            col_data['column_index'] = column_index
-            col_data['column_default'] = column_default
-            col_data['not_null'] = not is_nullable
-            col_data['is_updateable'] = is_updateable
-            col_data['get_value_on_insert'] = get_value_on_insert
-            col_data['is_primary_key'] = is_primary_key
-            col_data['length'] = column[7]
-            if column_name in foreign_keys:
-                foreign_key = foreign_keys[column_name]
-                col_data['foreign_key'] = foreign_key
-
-            columns.append(col_data)
-        tables[table_name] = {}
-        tables[table_name]['columns'] = columns
-        tables[table_name]['foreign_key_targets'] = foreign_key_targets
+    for foreign_key in cursor:
+        table_name, column_name, referenced_table_name, referenced_column_name = foreign_key
+        if table_name in tables:
+            for column in tables[table_name]['columns']:
+                if column['column_name'] == column_name:
+                    column['foreign_key'] = (referenced_table_name, referenced_column_name)
+        if referenced_table_name in tables:
+            tables[referenced_table_name]['foreign_key_targets'].append(
+                (table_name, column_name, referenced_column_name))
 
     return tables
 
 
+def _create_column_data(column_name, postgres_type, udt_name, ordinal_position, column_default,
+                        is_nullable, is_updateable, character_maximum_length, is_primary_key, is_enum):
+    col_data = {}
+    if is_enum:
+        # enum values come back as strings so treat them as text, the udt name lets defaults lose their cast
+        postgres_type = udt_name
+        data_type = mro.data_types.type_map['text']
+    elif postgres_type == 'USER-DEFINED':
+        # custom types are referenced by name so the tables stay plain data that can be cached
+        postgres_type = udt_name
+        data_type = [postgres_type, mro.custom_types.customColumnToDataType, mro.data_types.default_transform]
+        col_data['custom_type'] = postgres_type
+    else:
+        data_type = mro.data_types.type_map[postgres_type]
+    get_value_on_insert = False
+
+    if column_default:
+        column_default, get_value_on_insert = data_type[2](column_default, postgres_type)
+
+    col_data['data_type'] = data_type[0]
+    col_data['column_name'] = column_name
+    col_data['column_index'] = ordinal_position - 1
+    col_data['column_default'] = column_default
+    col_data['not_null'] = not is_nullable
+    col_data['is_updateable'] = is_updateable
+    col_data['get_value_on_insert'] = get_value_on_insert
+    col_data['is_primary_key'] = is_primary_key
+    col_data['length'] = character_maximum_length
+    return col_data
+
+
+def _update_function(self, **kwargs):
+    primary_key_columns = self.__class__._primary_key_columns
+    primary_key_column_values = [self.__dict__[c] for c in primary_key_columns]
+
+    self.__class__._update_row(primary_key_column_values, kwargs)
+
+    with mro.table.disable_insert():
+        for k, v in kwargs.items():
+            self.__dict__[k] = v
+        return self
+
+
+def _delete_function(self):
+    primary_key_columns = self.__class__._primary_key_columns
+    if not primary_key_columns:
+        raise ValueError("Delete needs a primary key to find the row, is your table missing one?")
+    self.__class__._delete_row([self.__dict__[c] for c in primary_key_columns])
+    self.__class__._remove_from_identity_map(self)
+
+
+def _init_table_object(self, kwargs, custom_types):
+    # Shared by the generated __init__ of every table class once the column defaults have been set
+    for column_name, custom_type in custom_types.items():
+        kwarg_for_column = kwargs.get(column_name)
+        if kwarg_for_column is not None and type(kwarg_for_column) is not custom_type:
+            kwargs[column_name] = custom_type(**kwarg_for_column)
+    for k, v in kwargs.items():
+        if not hasattr(self, k):
+            raise ValueError(f"{self.__class__.__name__} does not have an attribute {k}")
+        self.__dict__[k] = v
+
+    if not super(self.__class__, self)._insert.disabled:
+        obj = super(self.__class__, self).insert(**kwargs)
+        for c in self.__class__._get_value_on_insert_columns:
+            self.__dict__[c] = obj.__dict__[c]
+
+
 def _create_classes(tables):
     for table_name, table_data in tables.items():
         table_columns = table_data['columns']
         foreign_key_targets = table_data['foreign_key_targets']
 
         def create_table_class(name, columns):
-            def update_function(self, **kwargs):
-                primary_key_columns = self.__class__._primary_key_columns
-                primary_key_column_values = [self.__dict__[c] for c in primary_key_columns]
-
-                super(self.__class__, self).update(primary_key_columns, primary_key_column_values, **kwargs)
-
-                with mro.table.disable_insert():
-                    for k, v in kwargs.items():
-                        self.__dict__[k] = v
-                    return self
-
-            def delete_function(self):
-                primary_key_columns = self.__class__._primary_key_columns
-                primary_key_column_values = [self.__dict__[c] for c in primary_key_columns]
-                clause = " and ".join([c + '=%s' for c in primary_key_columns])
-                super(self.__class__, self).delete(clause, *primary_key_column_values)
+            custom_types = {column['column_name']: getattr(mro.custom_types, column['custom_type'])
+                            for column in columns if column.get('custom_type') is not None}
+            column_defaults = {column['column_name']: column['column_default'] for column in columns}
 
             def init_function(self, **kwargs):
-                for column in columns:
-                    self.__dict__[column['column_name']] = column['column_default']
-                    custom_type = column.get('custom_type')
-                    kwarg_for_column = kwargs.get(column['column_name'])
-                    if kwarg_for_column is not None:
-                        if custom_type is not None and type(kwarg_for_column) is not custom_type:
-                            kwargs[column['column_name']] = custom_type(**kwarg_for_column)
-                for k, v in kwargs.items():
-                    if not hasattr(self, k):
-                        raise ValueError(f"{self.__class__.__name__} does not have an attribute {k}")
-                    self.__dict__[k] = v
-
-                if not super(self.__class__, self)._insert.disabled:
-                    obj = super(self.__class__, self).insert(**kwargs)
-                    for c in self.__class__._get_value_on_insert_columns:
-                        self.__dict__[c] = obj.__dict__[c]
-
-                # Overriding the table wide update and delete methods so we can continue to use table methods on class objects.
-                # The MethodType use makes sure the function gets the object instance as argument when called.
-                self.update = types.MethodType(update_function, self)
-                self.delete = types.MethodType(delete_function, self)
-
-            attrib_dict = {'__init__': init_function}
+                self.__dict__.update(column_defaults)
+                _init_table_object(self, kwargs, custom_types)
+
+            # Overriding the table wide update and delete methods so we can continue to use table methods on class objects.
+            attrib_dict = {'__init__': init_function,
+                           '_column_defaults': column_defaults,
+                           'update': mro.table.row_method('update', _update_function),
+                           'delete': mro.table.row_method('delete', _delete_function)}
             table_class = type(name, (mro.table.table,), attrib_dict)
             return table_class
 
@@ -242,7 +544,7 @@ def _create_classes(tables):
             if column['data_type'] == 'varchar':
                 kwargs['length'] = column['length']
             if column.get('custom_type') is not None:
-                kwargs['python_type'] = column['custom_type']
+                kwargs['python_type'] = getattr(mro.custom_types, column['custom_type'])
 
             col_value = mro.data_types.__dict__[column['data_type']](**kwargs)
 
@@ -267,5 +569,6 @@ def _create_classes(tables):
                                                                f"mro.{foreign_key_target[0]}",
                                                                foreign_key_target[1]))
 
-        setattr(mro, dynamic_table_class.__name__, dynamic_table_class)
+        # register before publishing the class so other threads never see it half built
         dynamic_table_class._register()
+        _publish_table_class(dynamic_table_class)
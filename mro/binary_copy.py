@@ -0,0 +1,313 @@
+import datetime
+import queue
+import struct
+import threading
+import uuid
+
+import mro.connection
+import mro.data_types
+
+
+# The binary copy format counts timestamps in microseconds and dates in days from 2000-01-01,
+# these move them to the unix epoch used by the numpy arrays from select_arrays
+POSTGRES_EPOCH_MICROSECONDS = 946684800000000
+POSTGRES_EPOCH_DAYS = 10957
+
+HEADER = b'PGCOPY\n\xff\r\n\x00'
+
+# How each data type is selected so its binary form is known, the numpy type to read all of a batch's values with
+# at once if they have a fixed width, and the code to decode a value of length n at p. Anything else is selected as text.
+_binary_columns = {
+    'integer': ('"{}"::int8', '>i8', "unpack_q(buffer, p)[0]"),
+    'oid': ('"{}"::int8', '>i8', "unpack_q(buffer, p)[0]"),
+    'double': ('"{}"::float8', '>f8', "unpack_d(buffer, p)[0]"),
+    'real': ('"{}"::float4', '>f4', "unpack_f(buffer, p)[0]"),
+    'boolean': ('"{}"::bool', 'u1', "buffer[p] != 0"),
+    'timestamp': ('"{}"::timestamp', '>i8', "timestamp_from_postgres(unpack_q(buffer, p)[0])"),
+    'date': ('"{}"::date', '>i4', "date_from_postgres(unpack_i(buffer, p)[0])"),
+    'time': ('"{}"::time', None, "time_from_microseconds(unpack_q(buffer, p)[0])"),
+    'uuid': ('"{}"::uuid', None, "UUID(bytes=bytes(buffer[p:p + 16]))"),
+    'bytea': ('"{}"::bytea', None, "bytes(buffer[p:p + n])"),
+    }
+_text_column = ('"{}"::text', None, "str(buffer[p:p + n], 'utf-8')")
+
+
+class incomplete_row(Exception):
+    pass
+
+
+class copy_cancelled(Exception):
+    pass
+
+
+def _time_from_microseconds(microseconds):
+    seconds, microsecond = divmod(microseconds, 1000000)
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return datetime.time(hour, minute, second, microsecond)
+
+
+# Infinite timestamps and dates are sent as the largest and smallest values, they have no datetime64 equivalent
+# so become None and then NaT like nulls
+
+def _timestamp_from_postgres(microseconds):
+    if microseconds == -2 ** 63 or microseconds == 2 ** 63 - 1:
+        return None
+    return microseconds + POSTGRES_EPOCH_MICROSECONDS
+
+
+def _date_from_postgres(days):
+    if days == -2 ** 31 or days == 2 ** 31 - 1:
+        return None
+    return days + POSTGRES_EPOCH_DAYS
+
+
+_decode_namespace = {'unpack_h': struct.Struct('!h').unpack_from,
+                     'unpack_i': struct.Struct('!i').unpack_from,
+                     'unpack_q': struct.Struct('!q').unpack_from,
+                     'unpack_d': struct.Struct('!d').unpack_from,
+                     'unpack_f': struct.Struct('!f').unpack_from,
+                     'time_from_microseconds': _time_from_microseconds,
+                     'timestamp_from_postgres': _timestamp_from_postgres,
+                     'date_from_postgres': _date_from_postgres,
+                     'UUID': uuid.UUID,
+                     'incomplete_row': incomplete_row,
+                     'struct': struct}
+
+
+def get_select_list(columns, data_type_names):
+    return ', '.join(_binary_columns.get(name, _text_column)[0].format(column)
+                     for column, name in zip(columns, data_type_names))
+
+
+def _compile_value_decoder(name):
+    return eval(f"lambda buffer, p, n: {_binary_columns.get(name, _text_column)[2]}", dict(_decode_namespace))
+
+
+def _compile_row_decoder(data_type_names):
+    # Generates a function decoding as many whole rows as are in the buffer into a list per column,
+    # it returns the position after the last whole row and whether the end of the copy was reached
+    lines = ["def decode_rows(buffer, p, end, columns):",
+             "    " + ''.join(f"append_{i} = columns[{i}].append; " for i in range(len(data_type_names))),
+             "    while True:",
+             "        row_start = p",
+             "        try:",
+             "            field_count = unpack_h(buffer, p)[0]",
+             "            if field_count == -1:",
+             "                return p + 2, True",
+             "            p += 2"]
+    for index, name in enumerate(data_type_names):
+        decode = _binary_columns.get(name, _text_column)[2]
+        lines += [f"            n = unpack_i(buffer, p)[0]",
+                  f"            p += 4",
+                  f"            if n == -1:",
+                  f"                v{index} = None",
+                  f"            else:",
+                  f"                if p + n > end:",
+                  f"                    raise incomplete_row()",
+                  f"                v{index} = {decode}",
+                  f"                p += n"]
+    lines += ["        except (incomplete_row, struct.error, IndexError):",
+              "            return row_start, False",
+              "        " + ''.join(f"append_{i}(v{i}); " for i in range(len(data_type_names)))]
+    namespace = dict(_decode_namespace)
+    exec('\n'.join(lines) + '\n', namespace)
+    return namespace['decode_rows']
+
+
+class binary_decoder(object):
+    # A file like object for cursor.copy_expert which decodes the binary copy format as it is written,
+    # so only the rows of the current batch are ever held before they become numpy arrays
+
+    def __init__(self, column_names, data_type_names, masked, batch_size, on_batch):
+        self.column_names = column_names
+        self.data_type_names = data_type_names
+        self.dtypes = [mro.data_types.numpy_type_map.get(name, 'object') for name in data_type_names]
+        self.masked = masked
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.decode_rows = None
+        self.value_decoders = {}
+        self.chunks = []
+        self.pending = b''
+        self.header_read = False
+        self.finished = False
+
+    def write(self, data):
+        if not self.header_read:
+            data = self._read_header(data)
+            if not data:
+                return
+        self.chunks.append(data)
+        if len(self.chunks) >= self.batch_size:
+            self.flush()
+
+    def _read_header(self, data):
+        data = self.pending + data
+        # signature, flags and the length of the header extension
+        if len(data) < 19:
+            self.pending = data
+            return None
+        if data[:11] != HEADER:
+            raise ValueError("Unexpected binary copy header.")
+        self.pending = b''
+        self.header_read = True
+        return data[19 + struct.unpack_from('!i', data, 15)[0]:]
+
+    def flush(self):
+        chunks, self.chunks = self.chunks, []
+        # psycopg2 writes each copy message as it arrives and the server sends a message per row,
+        # so usually every chunk is one row and the whole batch can be decoded a column at a time
+        if chunks and chunks[-1] == b'\xff\xff':
+            chunks.pop()
+            self.finished = True
+        if not chunks:
+            return
+        columns = None
+        if not self.pending:
+            columns = self._decode_columns(chunks)
+        if columns is None:
+            columns = self._decode_stream(self.pending + b''.join(chunks))
+        if columns is not None:
+            self.on_batch(dict(zip(self.column_names, columns)))
+
+    def _decode_columns(self, rows):
+        import numpy
+
+        data = b''.join(rows)
+        buffer = numpy.frombuffer(data, dtype=numpy.uint8)
+        lengths = numpy.fromiter(map(len, rows), dtype=numpy.int64, count=len(rows))
+        ends = numpy.cumsum(lengths)
+        starts = ends - lengths
+        last = len(buffer) - 1
+
+        def read(positions, dtype):
+            # gathers the bytes at each position into one value per row, clipped so null fields can't read past the end
+            width = numpy.dtype(dtype).itemsize
+            indices = numpy.minimum(positions[:, None] + numpy.arange(width), last)
+            return buffer[indices].view(dtype).reshape(len(positions))
+
+        if len(rows) == 0 or lengths.min() < 2 or (read(starts, '>i2') != len(self.column_names)).any():
+            return None
+
+        # Find every value from the length fields before decoding any, so if a row doesn't end where its chunk
+        # does, and the chunks weren't whole rows after all, nothing has been decoded from the wrong place
+        fields = []
+        positions = starts + 2
+        for name in self.data_type_names:
+            field_lengths = read(positions, '>i4').astype(numpy.int64)
+            positions = positions + 4
+            fields.append((positions, field_lengths))
+            positions = positions + numpy.maximum(field_lengths, 0)
+        if (positions != ends).any():
+            return None
+
+        columns = []
+        for name, dtype, masked, (positions, field_lengths) in zip(self.data_type_names, self.dtypes, self.masked, fields):
+            nulls = field_lengths < 0
+            fixed_width_type = _binary_columns.get(name, _text_column)[1]
+            if fixed_width_type is not None:
+                values = read(positions, fixed_width_type)
+                columns.append(self._convert_fixed_width(name, dtype, values, nulls, masked))
+            else:
+                values = numpy.empty(len(rows), dtype=object)
+                if name not in _binary_columns:
+                    # text is by far the most common so is decoded inline rather than through a function call
+                    values[:] = [None if n < 0 else str(data[p:p + n], 'utf-8')
+                                 for p, n in zip(positions.tolist(), field_lengths.tolist())]
+                else:
+                    decode = self._get_value_decoder(name)
+                    values[:] = [None if n < 0 else decode(data, p, n)
+                                 for p, n in zip(positions.tolist(), field_lengths.tolist())]
+                columns.append(values)
+        return columns
+
+    def _get_value_decoder(self, name):
+        decode = self.value_decoders.get(name)
+        if decode is None:
+            decode = self.value_decoders[name] = _compile_value_decoder(name)
+        return decode
+
+    @staticmethod
+    def _convert_fixed_width(name, dtype, values, nulls, masked):
+        import numpy
+
+        if name == 'timestamp' or name == 'date':
+            limits = numpy.iinfo(values.dtype)
+            # infinite values are sent as the largest and smallest values, see _timestamp_from_postgres
+            nulls = nulls | (values == limits.min) | (values == limits.max)
+            values = values.astype(numpy.int64) + (POSTGRES_EPOCH_MICROSECONDS if name == 'timestamp' else POSTGRES_EPOCH_DAYS)
+            values[nulls] = numpy.iinfo(numpy.int64).min
+            return values.view(dtype)
+        values = values != 0 if name == 'boolean' else values.astype(dtype)
+        # the same types as select_arrays, see mro.data_types.masked_numpy_types
+        if masked:
+            values[nulls] = 0
+            return numpy.ma.MaskedArray(values, mask=nulls)
+        if nulls.any():
+            values[nulls] = numpy.nan
+        return values
+
+    def _decode_stream(self, data):
+        # The slower general way, which copes with rows split across chunks by carrying the rest over to the next batch
+        if self.decode_rows is None:
+            self.decode_rows = _compile_row_decoder(self.data_type_names)
+        columns = [[] for c in self.column_names]
+        p, finished = self.decode_rows(data, 0, len(data), columns)
+        self.finished = self.finished or finished
+        self.pending = b'' if finished else data[p:]
+        if not columns[0]:
+            return None
+        return [mro.data_types.convert_python_to_numpy(values, dtype, masked)
+                for values, dtype, masked in zip(columns, self.dtypes, self.masked)]
+
+
+def copy_out_batches(sql, values, column_names, data_type_names, masked, batch_size):
+    # The copy runs in another thread on a connection opened for this call and closed after, handing over a batch
+    # of arrays at a time, so the caller can work through a large table without it all being in memory or blocking
+    # other queries. Opening the connection is a fixed cost on every call so this is for reading many rows.
+    batches = queue.Queue(maxsize=2)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise copy_cancelled()
+
+    def run():
+        try:
+            connection = mro.connection.connection_function()
+            try:
+                cursor = connection.cursor()
+                decoder = binary_decoder(column_names, data_type_names, masked, batch_size, put)
+                query = cursor.mogrify(sql, values).decode('utf-8')
+                cursor.copy_expert(f"copy ({query}) to stdout (format binary)", decoder)
+                decoder.flush()
+                connection.rollback()
+            finally:
+                connection.close()
+            put(done)
+        except copy_cancelled:
+            pass
+        except Exception as e:
+            if not stop.is_set():
+                put(e)
+
+    thread = threading.Thread(target=run, name='mro-copy-out', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
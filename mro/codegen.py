@@ -0,0 +1,143 @@
+"""Generate a python module of table classes from a database schema, so a deployment can load it with
+mro.load_database(connection_function, schema_module=...) rather than reflecting the database on every start.
+
+Usage:
+    python -m mro.codegen my_connection:get_connection my_schema.py
+"""
+import argparse
+import importlib
+import keyword
+import pprint
+
+import mro
+
+
+def generate(connection, output_file):
+    schema = mro._introspect_schema(connection)
+    with open(output_file, 'w') as f:
+        f.write(generate_source(schema))
+
+
+def generate_source(schema):
+    # oids differ between databases so they are looked up by name when the module is loaded
+    custom_types = [{k: v for k, v in custom_type.items() if k not in ('oid', 'array_oid')}
+                    for custom_type in schema['custom_types']]
+    table_names = list(schema['tables'])
+    class_names = [_class_name(table_name, index) for index, table_name in enumerate(table_names)]
+
+    lines = ['# Generated by mro.codegen, do not edit.',
+             '# Regenerate it from the database with: python -m mro.codegen <connection function> <output file>',
+             'import mro',
+             'import mro.custom_types',
+             'import mro.data_types',
+             'import mro.foreign_keys',
+             'import mro.table',
+             '',
+             f"custom_types = {pprint.pformat(custom_types)}",
+             '',
+             f"routines = {pprint.pformat(schema['routines'])}",
+             '',
+             '',
+             'def create_classes():',
+             '    # Called once the custom types exist as the columns may use them']
+
+    for table_name, class_name in zip(table_names, class_names):
+        lines.append('')
+        lines.extend(_generate_class(table_name, class_name, schema['tables'][table_name]))
+
+    lines.append('')
+    lines.append(f"    return [{', '.join(class_names)}]")
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _generate_class(table_name, class_name, table_data):
+    columns = table_data['columns']
+    custom_types = ', '.join(f"{column['column_name']!r}: mro.custom_types.{column['custom_type']}"
+                             for column in columns if column.get('custom_type') is not None)
+
+    attributes = []
+    for column in columns:
+        attributes.append((column['column_name'], _generate_column(column)))
+
+    column_names = [column['column_name'] for column in columns]
+    for foreign_key_target in table_data['foreign_key_targets']:
+        foreign_key_name = f"{foreign_key_target[0]}s"
+        # if they happen to have a column the same name as the reference list don't add it
+        if foreign_key_name not in column_names:
+            attributes.append((foreign_key_name,
+                               f"mro.foreign_keys.foreign_key_reference({foreign_key_target[2]!r}, "
+                               f"'mro.{foreign_key_target[0]}', {foreign_key_target[1]!r})"))
+
+    column_defaults = ', '.join(f"{column['column_name']!r}: {column['column_default']!r}" for column in columns)
+
+    lines = [f'    class {class_name}(mro.table.table):',
+             f'        _custom_types = {{{custom_types}}}',
+             f'        _column_defaults = {{{column_defaults}}}',
+             "        update = mro.table.row_method('update', mro._update_function)",
+             "        delete = mro.table.row_method('delete', mro._delete_function)",
+             '']
+    for name, value in attributes:
+        if _is_identifier(name):
+            lines.append(f'        {name} = {value}')
+    lines.append('')
+    lines.append('        def __init__(self, **kwargs):')
+    for column in columns:
+        lines.append(f"            self.__dict__[{column['column_name']!r}] = {column['column_default']!r}")
+    lines.append('            mro._init_table_object(self, kwargs, self._custom_types)')
+
+    # names which can't be written in a class body are added afterwards
+    if class_name != table_name:
+        lines.append(f'    {class_name}.__name__ = {class_name}.__qualname__ = {table_name!r}')
+    for name, value in attributes:
+        if not _is_identifier(name):
+            lines.append(f'    setattr({class_name}, {name!r}, {value})')
+    return lines
+
+
+def _generate_column(column):
+    kwargs = [f"name={column['column_name']!r}",
+              f"column_index={column['column_index']!r}",
+              f"not_null={column['not_null']!r}",
+              f"is_updateable={column['is_updateable']!r}",
+              f"get_value_on_insert={column['get_value_on_insert']!r}",
+              f"is_primary_key={column['is_primary_key']!r}"]
+    if column['data_type'] == 'varchar':
+        kwargs.append(f"length={column['length']!r}")
+    if column.get('custom_type') is not None:
+        kwargs.append(f"python_type=mro.custom_types.{column['custom_type']}")
+    data_type = f"mro.data_types.{column['data_type']}({', '.join(kwargs)})"
+
+    if column.get('foreign_key') is None:
+        return data_type
+    return (f"mro.foreign_keys.foreign_key_data_type({column['column_name']!r}, {data_type}, "
+            f"'mro.{column['foreign_key'][0]}', {column['foreign_key'][1]!r})")
+
+
+def _class_name(table_name, index):
+    return table_name if _is_identifier(table_name) else f'_table_{index}'
+
+
+def _is_identifier(name):
+    # mro is also excluded as the generated code refers to the package by that name
+    return name.isidentifier() and not keyword.iskeyword(name) and name != 'mro'
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog='python -m mro.codegen', description='Generate mro table classes from a database schema.')
+    parser.add_argument('connection_function', help='function returning a database connection, as module:function')
+    parser.add_argument('output_file', help='python file to write the generated module to')
+    args = parser.parse_args(args)
+
+    module_name, function_name = args.connection_function.split(':')
+    connection_function = getattr(importlib.import_module(module_name), function_name)
+
+    connection = connection_function()
+    try:
+        generate(connection, args.output_file)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,59 @@
 import mro
 import datetime
 import csv
-import psycopg2.extensions, psycopg2.extras
+import psycopg2.extensions
 from operator import attrgetter
 
 
-def _get_custom_type_names(connection):
+def _get_custom_types(connection):
+    # Get every composite and enum type along with the fields of the composite types in one go.
+    # Only stand alone composite types are included, not the row types postgres creates for each table.
     cursor = connection.cursor()
-    # Get custom types
-    # 'lo' is a type that comes from the lo extension
-    cursor.execute("""SELECT t.typname as type
-                                FROM pg_type t
-                                LEFT JOIN pg_catalog.pg_namespace n
-                                       ON n.oid = t.typnamespace
-                                WHERE 
-                                (
-                                      t.typrelid = 0 
-                                      OR 
-                                      (
-                                           SELECT c.relkind = 'c' 
-                                           FROM pg_catalog.pg_class c
-                                           WHERE c.oid = t.typrelid
-                                      )
-                                ) 
-                                AND NOT EXISTS
-                                (
-                                      SELECT 1
-                                      FROM pg_catalog.pg_type el 
-                                      WHERE el.oid = t.typelem
-                                      AND el.typarray = t.oid
-                                )
-                                AND n.nspname NOT IN 
-                                (
-                                      'pg_catalog',
-                                      'information_schema'
-                                )
-                                AND t.typname != 'lo'
-                        """)
+    cursor.execute("""
+        select
+             t.oid
+            ,t.typname
+            ,t.typtype
+            ,t.typarray
+            ,a.attname
+            ,pg_catalog.format_type(a.atttypid, null)
+        from pg_catalog.pg_type t
+        left join pg_catalog.pg_class c on c.oid = t.typrelid
+        left join pg_catalog.pg_attribute a on a.attrelid = t.typrelid and a.attnum > 0 and not a.attisdropped
+        where
+                t.typnamespace = 'public'::regnamespace
+            and (t.typtype = 'e' or (t.typtype = 'c' and c.relkind = 'c'))
+        order by t.oid, a.attnum;
+    """)
     connection.commit()
-    types = [t for t in cursor]
-    return types
+
+    custom_types = {}
+    for row in cursor:
+        oid, type_name, type_type, array_oid, field_name, field_type = row
+        if oid not in custom_types:
+            custom_types[oid] = {'name': type_name,
+                                 'oid': oid,
+                                 'array_oid': array_oid,
+                                 'is_enum': type_type == 'e',
+                                 'fields': []}
+        if field_name is not None:
+            custom_types[oid]['fields'].append((field_name, field_type))
+    return list(custom_types.values())
+
+
+def _get_custom_type_oids(connection, custom_types):
+    cursor = connection.cursor()
+    cursor.execute("""
+        select t.typname, t.oid, t.typarray
+        from pg_catalog.pg_type t
+        where
+                t.typnamespace = 'public'::regnamespace
+            and t.typname::text = any(%s);
+    """, ([custom_type['name'] for custom_type in custom_types],))
+    connection.commit()
+    oids = {row[0]: (row[1], row[2]) for row in cursor}
+    return [dict(custom_type, oid=oids[custom_type['name']][0], array_oid=oids[custom_type['name']][1])
+            for custom_type in custom_types]
 
 
 def customColumnToDataType(column, code_start, code_end):
@@ -101,30 +115,29 @@ class CustomFieldType:
         raise NotImplementedError("You cannot set custom type internal attributes")
 
 
-def create_custom_types(connection):
-    custom_types = _get_custom_type_names(connection)
+# Type casters are per connection so keep hold of them to register again after a reconnect
+_typecasters = []
+_custom_type_names = set()
+
+
+def register_custom_types(connection):
+    for typecaster in _typecasters:
+        psycopg2.extensions.register_type(typecaster, connection)
+
 
+def create_custom_types(connection, custom_types):
+    _typecasters.clear()
+    _custom_type_names.clear()
+    _custom_type_names.update(custom_type['name'] for custom_type in custom_types)
     for custom_type in custom_types:
-        type_name = custom_type[0]
-        if type_name == 'hstore' or type_name == 'ghstore':
+        # enum values are returned as strings by psycopg2 so enum columns are treated as text
+        if custom_type['is_enum']:
             continue
+        type_name = custom_type['name']
+        fields = [tuple(field) for field in custom_type['fields']]
+        custom_object_oid = custom_type['oid']
+        custom_array_oid = custom_type['array_oid']
         mro.data_types.type_map[type_name] = [type_name, customColumnToDataType, mro.data_types.default_transform]
-        psycopg2.extras.register_composite(type_name, connection)
-
-        cursor2 = connection.cursor()
-        cursor2.execute(f"""
-                          SELECT a.attname AS "Field",
-                                 pg_catalog.format_type(a.atttypid, a.atttypmod) AS "Datatype"
-                          FROM pg_attribute AS a
-                          WHERE attrelid IN
-                          (
-                             SELECT typrelid
-                             FROM pg_type
-                             WHERE typname = '{type_name}'
-                          );
-                       """)
-        connection.commit()
-        fields = [field for field in cursor2]
 
         # Create the python custom class
         def create_custom_type(name, fields):
@@ -157,21 +170,13 @@ def create_custom_types(connection):
                         dict[col_name] = postgres_type_to_python_map[col_type](col_value)
                 return new_custom_class(**dict)
 
-            cursor3 = connection.cursor()
-            # Get the postgres type object id for this custom type
-            cursor3.execute(f"""
-                                SELECT pg_type.oid
-                                  FROM pg_type
-                                      JOIN pg_namespace
-                                        ON typnamespace = pg_namespace.oid
-                                 WHERE typname = '{type_name}'
-                                   AND nspname = 'public'
-                                   """)
-            connection.commit()
-            custom_object_oid = cursor3.fetchone()[0]
             new_custom_type = psycopg2.extensions.new_type((custom_object_oid,), new_custom_class.__name__,
                                                            cast_custom)
-            psycopg2.extensions.register_type(new_custom_type, connection)
+            _typecasters.append(new_custom_type)
+            if custom_array_oid:
+                _typecasters.append(psycopg2.extensions.new_array_type((custom_array_oid,),
+                                                                       f"{new_custom_class.__name__}ARRAY",
+                                                                       new_custom_type))
 
             def adapt_custom_type(custom_type):
                 fields = []
@@ -215,3 +220,4 @@ def create_custom_types(connection):
                                attrib_dict)
         setattr(mro.data_types, custom_db_class.__name__, custom_db_class)
 
+    register_custom_types(connection)
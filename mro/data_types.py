@@ -63,12 +63,73 @@ type_map = {
     }
 
 
+# numpy dtypes for the data types above when selecting into arrays, anything not listed is kept as python objects
+numpy_type_map = {
+    'integer': 'int64',
+    'oid': 'int64',
+    'double': 'float64',
+    'real': 'float64',
+    'boolean': 'bool',
+    'timestamp': 'datetime64[us]',
+    'date': 'datetime64[D]',
+    }
+
+# Integers and booleans have no null value of their own, so nullable columns of them come back as masked arrays
+# rather than changing type when a batch has a null. Floats use NaN and dates and timestamps NaT.
+masked_numpy_types = {'int64', 'bool'}
+
+# Dates and times are selected as whole microseconds or days since the epoch for arrays,
+# which numpy can take directly rather than converting every python datetime.
+# Infinite values have no datetime64 equivalent so are selected as null and become NaT.
+numpy_select_map = {
+    'timestamp': 'case when isfinite("{0}") then (extract(epoch from "{0}") * 1000000)::bigint end',
+    'date': 'case when isfinite("{0}") then "{0}" - date \'1970-01-01\' end',
+    }
+
+
 def convert_numpy_to_python(value):
     if hasattr(value, 'dtype'):
         value = value.item()
     return value
 
 
+def convert_python_to_numpy(values, dtype, masked=False):
+    # numpy is only needed by the callers of select_arrays and select_frame so isn't a requirement of mro
+    import numpy
+
+    if dtype.startswith('datetime64'):
+        # NaT is stored as the smallest int64
+        if None in values:
+            values = [numpy.iinfo(numpy.int64).min if value is None else value for value in values]
+        return numpy.fromiter(values, dtype='int64', count=len(values)).view(dtype)
+
+    if masked:
+        mask = numpy.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        if mask.any():
+            values = [0 if value is None else value for value in values]
+        return numpy.ma.MaskedArray(numpy.fromiter(values, dtype=dtype, count=len(values)), mask=mask)
+
+    if dtype == 'float64' and None in values:
+        values = [numpy.nan if value is None else value for value in values]
+
+    if dtype == 'object':
+        # filling an empty array stops numpy turning sequence values such as tuples into extra dimensions
+        array = numpy.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    return numpy.fromiter(values, dtype=dtype, count=len(values))
+
+
+def concatenate_numpy(batches, dtype, masked=False):
+    import numpy
+
+    if masked:
+        if not batches:
+            return numpy.ma.MaskedArray(numpy.empty(0, dtype=dtype), mask=numpy.empty(0, dtype=bool))
+        return numpy.ma.concatenate(batches)
+    return numpy.concatenate(batches) if batches else numpy.empty(0, dtype=dtype)
+
+
 class database_type(object):
 
     def __init__(self, name, python_type, column_index, not_null, is_updateable, get_value_on_insert, is_primary_key):
@@ -85,7 +146,9 @@ class database_type(object):
             return self
         if self.name in instance.__dict__:
             return instance.__dict__[self.name]
-        return None
+        # the column wasn't selected, so load it now
+        instance._load_missing_columns(self.name)
+        return instance.__dict__.get(self.name)
 
     def __set__(self, instance, value):
         value = convert_numpy_to_python(value)
@@ -106,6 +169,22 @@ class database_type(object):
         pass
 
 
+class compact_column(object):
+    # Column access for compact rows, which keep their values in a tuple shared layout rather than an instance __dict__
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+
+    def __get__(self, instance, instance_type):
+        if instance is None:
+            return self
+        return instance[self.index]
+
+    def __set__(self, instance, value):
+        raise PermissionError(f'The value of [{self.name}] is not updateable on a compact row.')
+
+
 class varchar(database_type):
 
     def __init__(self, name, column_index, length, **kwargs):
@@ -60,7 +60,17 @@ class foreign_key(object):
             if value == None:
                 self.__dict__['object'] = None
             else:
-                self.__dict__['object'] = self.reference_class.select_one("{} = {}".format(self.reference_column_name, value))
+                # a reference to the primary key can use get, which also checks the identity map
+                if self.reference_class._primary_key_columns == [self.reference_column_name]:
+                    loader = mro.table.table._loader.loader
+                    if loader is None:
+                        obj = self.reference_class.get(value)
+                    else:
+                        loader.queue_foreign_keys(self.owner, self.data_type.name, self.reference_class)
+                        obj = loader.load(self.reference_class, value)
+                else:
+                    obj = self.reference_class.select_one("{} = {}".format(self.reference_column_name, value))
+                self.__dict__['object'] = obj
             return self.__dict__['object']
         else:
             raise AttributeError("Attribute [{}] does not exist.".format(attribute))
@@ -113,10 +123,16 @@ class foreign_key_reference(object):
         if self.name in instance.__dict__:
             return instance.__dict__[self.name]
 
+        return self.load(instance)
+
+    def load(self, instance, columns=None):
+        # Builds the list for instance straight away with only the columns given, e.g. mro.user.orders.load(user, columns=['total']),
+        # rather than loading every column on first use and then selecting again
         if isinstance(self.referring_class, str):
             self.referring_class = eval(self.referring_class)
 
-        instance.__dict__[self.name] = foreign_key_reference_list(instance, self.target_column, self.referring_class, self.referring_column)
+        instance.__dict__[self.name] = foreign_key_reference_list(instance, self.target_column, self.referring_class,
+                                                                  self.referring_column, columns)
         return instance.__dict__[self.name]
 
     def __set__(self, instance, value):
@@ -125,13 +141,13 @@ class foreign_key_reference(object):
 
 class foreign_key_reference_list(list):
 
-    def __init__(self, target_instance, target_column, referring_class, referring_column):
+    def __init__(self, target_instance, target_column, referring_class, referring_column, columns=None):
         self.target_instance = target_instance
         self.target_column = target_column
         self.referring_class = referring_class
         self.referring_column = referring_column
         super().__init__(self)
-        super().extend(self.referring_class.select(self.referring_column + '=' + str(getattr(self.target_instance, self.target_column))))
+        super().extend(self._select(columns))
 
     def __getitem__(self, key):
         return super().__getitem__(key)
@@ -139,9 +155,13 @@ class foreign_key_reference_list(list):
     def __setitem__(self, key, item):
         raise PermissionError("Cannot set specific value on foreign key reference list.")
 
-    def __call__(self):
+    def __call__(self, columns=None):
         super().clear()
-        super().extend(self.referring_class.select(self.referring_column + '=' + str(getattr(self.target_instance, self.target_column))))
+        super().extend(self._select(columns))
+
+    def _select(self, columns):
+        return self.referring_class.select(self.referring_column + '=' + str(getattr(self.target_instance, self.target_column)),
+                                           columns=columns)
 
     def append(self, object):
         setattr(object, self.referring_column, getattr(self.target_instance, self.target_column))
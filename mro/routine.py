@@ -57,63 +57,65 @@ class Routine:
         return objs
 
 
-def _create_routines(connection):
+def _get_routines(connection):
+    # Get every routine along with all of its parameters and its return type in one go.
+    # Using postgres specific tables because out parameters are not available in the information schema,
+    # and keying on the oid rather than the name keeps the parameters of overloaded routines separate.
     cursor = connection.cursor()
-    cursor.execute("select * from information_schema.routines where routine_type in ('PROCEDURE', 'FUNCTION') and routine_schema = 'public'")
+    cursor.execute("""
+        select
+             p.oid
+            ,p.proname as routine_name
+            ,case p.prokind when 'p' then 'PROCEDURE' else 'FUNCTION' end as routine_type
+            ,rt.typname as return_type
+            ,a.name
+            ,coalesce(a.mode, 'i') as mode
+            ,t.typname
+            ,case
+                when t.typelem <> 0 and t.typlen = -1 then 'ARRAY'
+                when tn.nspname = 'pg_catalog' then pg_catalog.format_type(t.oid, null)
+                else 'USER-DEFINED'
+             end as data_type
+        from pg_catalog.pg_proc p
+        join pg_catalog.pg_type rt on rt.oid = p.prorettype
+        left join lateral unnest(coalesce(p.proallargtypes, p.proargtypes::oid[]), p.proargmodes, p.proargnames)
+            with ordinality as a(type_oid, mode, name, ordinal_position) on true
+        left join pg_catalog.pg_type t on t.oid = a.type_oid
+        left join pg_catalog.pg_namespace tn on tn.oid = t.typnamespace
+        where
+                p.pronamespace = 'public'::regnamespace
+            and p.prokind in ('f', 'p')
+            and p.prorettype <> 'pg_catalog.event_trigger'::regtype
+        order by p.oid, a.ordinal_position;
+    """)
     connection.commit()
 
-    column_name_index_map = mro.helpers.create_column_name_index_map(cursor)
-    for routine in cursor:
-        routine_name = routine[column_name_index_map['routine_name']]
-        routine_type = routine[column_name_index_map['routine_type']]
-        specific_name = routine[column_name_index_map['specific_name']]
-
-        cursor2 = connection.cursor()
-        cursor2.execute(f"select * from information_schema.parameters where specific_name='{specific_name}' and parameter_mode <> 'OUT' order by ordinal_position;")
-        connection.commit()
-
-        in_parameters = []
-        cim = mro.helpers.create_column_name_index_map(cursor2)
-        for parameter in cursor2:
-            in_parameters.append(RoutineParameter(parameter[cim['parameter_name']], parameter[cim['data_type']], parameter[cim['parameter_mode']]))
-
-        # Using postgres specific tables because this information is not available in the information schema
-        command = """
-with r as (
-    select proallargtypes, proargnames, proargmodes, prorettype from pg_proc where proname='{}'
-), proallargtypes_expanded as (
-    select a.index, a.t as oid from r, unnest(proallargtypes) with ordinality as a(t, index)
-), proargnames_expanded as (
-    select a.index, a.n as name from r, unnest(proargnames) with ordinality as a(n, index)
-), proargmodes_expanded as (
-    select a.index, a.m as mode from r, unnest(proargmodes) with ordinality as a(m, index)
-), p as (
-    select proallargtypes_expanded.index, oid, name, mode from proallargtypes_expanded join proargnames_expanded on proallargtypes_expanded.index = proargnames_expanded.index join proargmodes_expanded on proallargtypes_expanded.index = proargmodes_expanded.index
-), params as (
-    select p.index, p.oid, p.name, typname as data_type, p.mode from p join pg_type t on p.oid = t.oid
-), outputs as (
-    select index, oid, name, data_type, 'OUT' as mode from params where mode in ('o', 'b', 't')
-)
-select * from outputs order by index""".format(routine[column_name_index_map['routine_name']])
-        cursor2 = connection.cursor()
-        cursor2.execute(command)
-        connection.commit()
-
-        out_parameters = []
-        cim = mro.helpers.create_column_name_index_map(cursor2)
-        for parameter in cursor2:
-            out_parameters.append(RoutineParameter(parameter[cim['name']], parameter[cim['data_type']], parameter[cim['mode']]))
-
-        command = """
-with r as (
-    select prorettype from pg_proc where proname='{}'
-)
-select typname from pg_type t join r on t.oid = r.prorettype""".format(routine[column_name_index_map['routine_name']])
-        cursor2 = connection.cursor()
-        cursor2.execute(command)
-        connection.commit()
-
-        return_type = next(cursor2)[0]
-
-        routine = Routine(routine_name, in_parameters, out_parameters, return_type, routine_type)
-        setattr(mro, routine_name, routine)
\ No newline at end of file
+    parameter_modes = {'i': 'IN', 'b': 'INOUT', 'v': 'IN'}
+    routines = {}
+    cim = mro.helpers.create_column_name_index_map(cursor)
+    for row in cursor:
+        oid = row[cim['oid']]
+        if oid not in routines:
+            routines[oid] = {'name': row[cim['routine_name']],
+                             'type': row[cim['routine_type']],
+                             'in_parameters': [],
+                             'out_parameters': [],
+                             'return_type': row[cim['return_type']]}
+        routine = routines[oid]
+        if row[cim['typname']] is None:
+            continue
+        mode = row[cim['mode']]
+        if mode in parameter_modes:
+            routine['in_parameters'].append((row[cim['name']], row[cim['data_type']], parameter_modes[mode]))
+        if mode in ('o', 'b', 't'):
+            routine['out_parameters'].append((row[cim['name']], row[cim['typname']], 'OUT'))
+
+    return list(routines.values())
+
+
+def _create_routines(routines):
+    for routine in routines:
+        in_parameters = [RoutineParameter(*parameter) for parameter in routine['in_parameters']]
+        out_parameters = [RoutineParameter(*parameter) for parameter in routine['out_parameters']]
+        routine_object = Routine(routine['name'], in_parameters, out_parameters, routine['return_type'], routine['type'])
+        setattr(mro, routine['name'], routine_object)
\ No newline at end of file
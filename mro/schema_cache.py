@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+
+# Bump this whenever the layout of the cached schema changes so old cache files are ignored
+CACHE_VERSION = 3
+
+
+def get_fingerprint(connection):
+    # The xmin of a catalog row changes whenever that row is rewritten by DDL, so hashing the xmins
+    # of the rows describing our schema gives a cheap single query check for whether it has changed.
+    # Temporary and system namespaces are left out so temp tables don't invalidate the cache.
+    cursor = connection.cursor()
+    cursor.execute("""
+        with n as (
+            select oid from pg_catalog.pg_namespace
+            where nspname not like 'pg\\_%' and nspname <> 'information_schema'
+        ), c as (
+            select oid, xmin from pg_catalog.pg_class where relnamespace in (select oid from n)
+        )
+        select md5(coalesce(string_agg(x, ',' order by x), ''))
+        from (
+            select 'c' || c.oid || ':' || c.xmin as x from c
+            union all
+            select 'a' || a.attrelid || ':' || a.attnum || ':' || a.xmin
+            from pg_catalog.pg_attribute a where a.attrelid in (select oid from c)
+            union all
+            select 'd' || d.oid || ':' || d.xmin
+            from pg_catalog.pg_attrdef d where d.adrelid in (select oid from c)
+            union all
+            select 'i' || i.indexrelid || ':' || i.xmin
+            from pg_catalog.pg_index i where i.indisprimary and i.indrelid in (select oid from c)
+            union all
+            select 'k' || k.oid || ':' || k.xmin
+            from pg_catalog.pg_constraint k where k.connamespace in (select oid from n)
+            union all
+            select 't' || t.oid || ':' || t.xmin
+            from pg_catalog.pg_type t where t.typnamespace in (select oid from n)
+            union all
+            select 'p' || p.oid || ':' || p.xmin
+            from pg_catalog.pg_proc p where p.pronamespace in (select oid from n)
+        ) s;
+    """)
+    fingerprint = cursor.fetchone()[0]
+    connection.commit()
+    return fingerprint
+
+
+def read(cache_file, fingerprint):
+    try:
+        with open(cache_file, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cached.get('version') != CACHE_VERSION or cached.get('fingerprint') != fingerprint:
+        return None
+    return cached['schema']
+
+
+def write(cache_file, fingerprint, schema):
+    cached = {'version': CACHE_VERSION, 'fingerprint': fingerprint, 'schema': schema}
+    directory = os.path.dirname(os.path.abspath(cache_file))
+    # The cache only speeds up the next start so failing to write it shouldn't stop this one
+    try:
+        # Write to a temporary file and move it into place so concurrent workers never read a partial file
+        handle, temp_file = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump(cached, f)
+            os.replace(temp_file, cache_file)
+        except Exception:
+            os.remove(temp_file)
+            raise
+    except OSError:
+        logger.warning("Could not write the schema cache file [%s].", cache_file, exc_info=True)
@@ -0,0 +1,129 @@
+import json
+import logging
+import select
+import threading
+
+import psycopg2
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'mro_schema_change'
+
+# How long to keep gathering notifications after the first one so a migration is handled in one refresh
+DEBOUNCE_SECONDS = 0.5
+
+_listener = None
+
+
+def install_event_trigger(connection):
+    # Event triggers need a superuser, so this is usually run once alongside the migrations rather than by every worker
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        create or replace function mro_notify_schema_change() returns event_trigger
+        language plpgsql
+        as $$
+        declare
+            r record;
+        begin
+            if tg_event = 'sql_drop' then
+                for r in select * from pg_event_trigger_dropped_objects() loop
+                    perform pg_notify('{CHANNEL}', json_build_object(
+                        'object_type', r.object_type,
+                        'schema', r.schema_name,
+                        'name', r.object_name,
+                        'dropped', true)::text);
+                end loop;
+            else
+                for r in select * from pg_event_trigger_ddl_commands() loop
+                    perform pg_notify('{CHANNEL}', json_build_object(
+                        'object_type', r.object_type,
+                        'schema', r.schema_name,
+                        'name', case r.classid
+                                    when 'pg_catalog.pg_class'::regclass then (select c.relname from pg_catalog.pg_class c where c.oid = r.objid)
+                                    when 'pg_catalog.pg_type'::regclass then (select t.typname from pg_catalog.pg_type t where t.oid = r.objid)
+                                    when 'pg_catalog.pg_proc'::regclass then (select p.proname from pg_catalog.pg_proc p where p.oid = r.objid)
+                                end,
+                        'dropped', false)::text);
+                end loop;
+            end if;
+        end
+        $$;
+    """)
+    cursor.execute("drop event trigger if exists mro_schema_change_ddl;")
+    cursor.execute("drop event trigger if exists mro_schema_change_drop;")
+    cursor.execute("create event trigger mro_schema_change_ddl on ddl_command_end execute procedure mro_notify_schema_change();")
+    cursor.execute("create event trigger mro_schema_change_drop on sql_drop execute procedure mro_notify_schema_change();")
+    connection.commit()
+
+
+def uninstall_event_trigger(connection):
+    cursor = connection.cursor()
+    cursor.execute("drop event trigger if exists mro_schema_change_ddl;")
+    cursor.execute("drop event trigger if exists mro_schema_change_drop;")
+    cursor.execute("drop function if exists mro_notify_schema_change();")
+    connection.commit()
+
+
+def start_listening(connection_function, on_change):
+    global _listener
+    stop_listening()
+    _listener = SchemaListener(connection_function, on_change)
+    _listener.start()
+    # Wait for the listener to be ready so no change made after loading the database is missed
+    _listener.listening.wait(10)
+
+
+def stop_listening():
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
+        # Wait for a refresh already running so it can't swap in classes after this returns
+        if listener is not threading.current_thread():
+            listener.join()
+
+
+class SchemaListener(threading.Thread):
+
+    def __init__(self, connection_function, on_change):
+        super().__init__(name='mro-schema-listener', daemon=True)
+        self.connection_function = connection_function
+        self.on_change = on_change
+        self.listening = threading.Event()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Schema listener failed, will reconnect.")
+                self._stop_event.wait(1)
+
+    def _listen(self):
+        # The listener has its own connection so waiting for notifications never blocks normal queries
+        connection = self.connection_function()
+        try:
+            connection.set_session(autocommit=True)
+            connection.cursor().execute(f'listen "{CHANNEL}";')
+            self.listening.set()
+            while not self._stop_event.is_set():
+                if select.select([connection], [], [], 1) == ([], [], []):
+                    continue
+                connection.poll()
+                self._stop_event.wait(DEBOUNCE_SECONDS)
+                connection.poll()
+
+                changes = [json.loads(notify.payload) for notify in connection.notifies]
+                connection.notifies.clear()
+                if changes and not self._stop_event.is_set():
+                    self.on_change(connection, changes)
+        finally:
+            try:
+                connection.close()
+            except psycopg2.Error:
+                pass
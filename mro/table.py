@@ -1,12 +1,21 @@
-﻿from contextlib import contextmanager
+﻿import collections
+from contextlib import contextmanager
+import functools
+import itertools
 import logging
 import threading
 import time
+import types
+import uuid
+import weakref
 
 import psycopg2
+import psycopg2.errors
 from tenacity import before_sleep_log, retry, stop_after_attempt, wait_random_exponential
 
+import mro.binary_copy
 import mro.connection as con
+import mro.custom_types
 import mro.data_types
 import mro.foreign_keys
 
@@ -19,6 +28,12 @@ psycopg2_lock = threading.Lock()
 
 MAX_ATTEMPTS = 3
 
+# The most insert and update statements kept per table, one for each set of columns used
+SQL_CACHE_SIZE = 256
+
+# The most statements kept prepared on the connection, the least recently used are deallocated past this
+PREPARED_STATEMENT_CACHE_SIZE = 256
+
 
 @contextmanager
 def disable_insert():
@@ -33,8 +48,317 @@ class insert_local(threading.local):
     disabled = False
 
 
+@contextmanager
+def identity_map():
+    # Within this block each row the thread loads is only ever one object, so selecting a row again or
+    # following a foreign key to it gives back the object already in memory. Nested blocks share the map.
+    previous = table._identity.map
+    if previous is None:
+        table._identity.map = weakref.WeakValueDictionary()
+    try:
+        yield table._identity.map
+    finally:
+        table._identity.map = previous
+
+
+class identity_local(threading.local):
+    map = None
+
+
+@contextmanager
+def batch_loads():
+    # Within this block following a foreign key from a row loads the referenced rows for every row from the same
+    # select in one query, and loader.get queues lookups by primary key to be made together when one is needed.
+    # Rows loaded are kept until the block ends or mro writes to their table, nested blocks share the loader.
+    previous = table._loader.loader
+    if previous is None:
+        table._loader.loader = batch_loader()
+    try:
+        yield table._loader.loader
+    finally:
+        table._loader.loader = previous
+
+
+class loader_local(threading.local):
+    loader = None
+
+
+class pending_row(object):
+    # A lookup queued with batch_loader.get, getting object loads it along with everything else that is queued
+
+    def __init__(self, loader, table_class, key):
+        self.loader = loader
+        self.table_class = table_class
+        self.key = key
+
+    @property
+    def object(self):
+        return self.loader.load(self.table_class, self.key)
+
+
+class row_batch(object):
+    # The rows from one select in a batch_loads block and the foreign key columns already queued for all of them
+
+    def __init__(self, objs):
+        self.rows = [weakref.ref(obj) for obj in objs]
+        self.queued_columns = set()
+
+
+class batch_loader(object):
+
+    def __init__(self):
+        # table class -> keys waiting to be loaded, a dict to keep them in order without duplicates
+        self.queued = {}
+        # table class -> {key: row, or None if there isn't one}
+        self.loaded = {}
+        # row -> the row_batch of the select it came from, kept out of the rows' __dict__
+        self.row_batches = weakref.WeakKeyDictionary()
+
+    def get(self, table_class, *primary_key_values):
+        if len(primary_key_values) != len(table_class._primary_key_columns):
+            raise ValueError(f"Get needs a value for each of the primary key columns {table_class._primary_key_columns}")
+        key = primary_key_values[0] if len(primary_key_values) == 1 else primary_key_values
+        self._queue(table_class, key)
+        return pending_row(self, table_class, key)
+
+    def load(self, table_class, key):
+        loaded = self.loaded.get(table_class)
+        if loaded is None or key not in loaded:
+            self._queue(table_class, key)
+            self.flush()
+        return self.loaded[table_class][key]
+
+    def flush(self):
+        queued, self.queued = self.queued, {}
+        for table_class, keys in queued.items():
+            keys = list(keys)
+            loaded = self.loaded.setdefault(table_class, {})
+            for key, obj in zip(keys, table_class.get_many(keys)):
+                loaded[key] = obj
+
+    def forget(self, table_class):
+        # Called after a write to the table, which may have changed, added or removed any of the rows loaded
+        self.loaded.pop(table_class, None)
+
+    def add_rows(self, objs):
+        batch = row_batch(objs)
+        row_batches = self.row_batches
+        for obj in objs:
+            row_batches[obj] = batch
+
+    def queue_foreign_keys(self, row, column_name, reference_class):
+        # Queues the rows referenced by column from all the rows selected along with this one,
+        # only the first time the column is followed from any of them so walking the rows stays linear
+        batch = self.row_batches.get(row)
+        if batch is None or column_name in batch.queued_columns:
+            return
+        batch.queued_columns.add(column_name)
+        for other in (r() for r in batch.rows):
+            if other is not None:
+                value = other.__dict__.get(column_name)
+                if value is not None:
+                    self._queue(reference_class, value)
+
+    def _queue(self, table_class, key):
+        if key not in self.loaded.get(table_class, ()):
+            self.queued.setdefault(table_class, {})[key] = None
+
+
+class row_method(object):
+    # Lets rows have their own version of a table wide classmethod such as update or delete
+    # without binding a method to every instance as it is created.
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def __get__(self, instance, instance_type):
+        if instance is None:
+            return table.__dict__[self.name].__get__(None, instance_type)
+        return types.MethodType(self.function, instance)
+
+
+class compact_row(tuple):
+    # Read only rows for large selects, the values are the tuple itself and the column names live on the class
+    __slots__ = ()
+    _column_names = ()
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={value!r}' for name, value in zip(self._column_names, self))
+        return f'{self.__class__.__name__}({values})'
+
+    def to_dict(self):
+        return dict(zip(self._column_names, self))
+
+
+class page(list):
+    # A page of rows from select_page, after is the key to pass for the next page and is None on the last page
+
+    def __init__(self, objs, after):
+        super().__init__(objs)
+        self.after = after
+
+
+class deferred_batch(object):
+    # The rows from one select that were fetched without some of their columns. When one row needs its
+    # missing columns they are loaded for all of the rows still around in a single query.
+
+    def __init__(self, table_class, objs):
+        self.table_class = table_class
+        self.rows = [weakref.ref(obj) for obj in objs]
+
+    def load(self):
+        rows, self.rows = self.rows, []
+        objs = [obj for obj in (row() for row in rows) if obj is not None]
+        for obj in objs:
+            self.table_class._deferred_batches.pop(obj, None)
+
+        cls = self.table_class
+        missing_columns = [c for c in cls._column_names if any(c not in obj.__dict__ for obj in objs)]
+        if not missing_columns:
+            return
+        primary_key_column = cls._primary_key_columns[0]
+        sql = "select \"{}\", {} from \"{}\" where \"{}\" = any(%s);".format(
+            primary_key_column, ', '.join(f'"{c}"' for c in missing_columns), cls.__name__, primary_key_column)
+
+        cursor = cls._execute_sql(sql, values=[[obj.__dict__[primary_key_column] for obj in objs]])
+        values = {row[0]: row[1:] for row in cursor}
+        for obj in objs:
+            row = values.get(obj.__dict__[primary_key_column])
+            if row is None:
+                continue
+            for column_name, value in zip(missing_columns, row):
+                # don't overwrite a value that has been set since the select
+                obj.__dict__.setdefault(column_name, value)
+
+
+class result_cache(object):
+    # The most recently used results of select, select_one and select_count on one table class, each kept for
+    # ttl seconds. Writes through mro clear it and move the generation on, so a select that was already
+    # running when the write happened doesn't put what is now an old result back.
+
+    def __init__(self, max_size=1000, ttl=60):
+        if max_size < 1:
+            raise ValueError(f"max_size should be at least 1 not {max_size}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def put(self, key, value, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            expires = None if self.ttl is None else time.monotonic() + self.ttl
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _cache_key(value):
+    # Lists of values for "= any(%s)" and similar are made hashable, anything else that isn't hashable isn't cached
+    if isinstance(value, mro.foreign_keys.foreign_key):
+        return value.value
+    if isinstance(value, (list, tuple)):
+        return tuple(_cache_key(v) for v in value)
+    hash(value)
+    return value
+
+
+def cached_result(function):
+    # Serves a select from the table's result cache when it has one, see enable_result_cache
+    @functools.wraps(function)
+    def wrapper(cls, *args, **kwargs):
+        cache = cls._result_cache
+        # the identity map has to see every row read so those selects always go to the database
+        if cache is None or table._identity.map is not None:
+            return function(cls, *args, **kwargs)
+        try:
+            key = (function.__name__, _cache_key(args), tuple(sorted((k, _cache_key(v)) for k, v in kwargs.items())))
+        except TypeError:
+            return function(cls, *args, **kwargs)
+
+        found, result = cache.get(key)
+        if not found:
+            generation = cache.generation
+            result = function(cls, *args, **kwargs)
+            cache.put(key, result, generation)
+        # callers get their own list, and their own dicts for as_='dict', so changing them doesn't change what is cached
+        if kwargs.get('as_') == 'dict':
+            if isinstance(result, list):
+                return [dict(row) for row in result]
+            return None if result is None else dict(result)
+        return list(result) if isinstance(result, list) else result
+    return wrapper
+
+
+class prepared_statements(object):
+    # The statements prepared on the current connection, by their sql, most recently used last. Prepared statements
+    # only last as long as the connection they were prepared on so when it changes, e.g. after a reconnect,
+    # they are prepared again as they are used.
+
+    def __init__(self):
+        self.connection = None
+        self.statements = collections.OrderedDict()
+        self.names = itertools.count()
+
+    def get(self, cursor, sql, parameter_count):
+        if cursor.connection is not self.connection:
+            self.connection = cursor.connection
+            self.statements = collections.OrderedDict()
+        statement = self.statements.get(sql)
+        if statement is not None:
+            self.statements.move_to_end(sql)
+            return statement[1]
+
+        while len(self.statements) >= PREPARED_STATEMENT_CACHE_SIZE:
+            old_sql, (old_name, old_execute_sql) = self.statements.popitem(last=False)
+            cursor.execute(f"deallocate {old_name}")
+        name = f"mro_{next(self.names)}"
+        cursor.execute(f"prepare {name} as {sql}")
+        parameters = ', '.join(['%s'] * parameter_count)
+        execute_sql = f"execute {name} ({parameters})" if parameter_count else f"execute {name}"
+        self.statements[sql] = (name, execute_sql)
+        return execute_sql
+
+    def discard(self, sql):
+        # Forgets the statement so it is prepared again, returning its name
+        statement = self.statements.pop(sql, None)
+        return None if statement is None else statement[0]
+
+
+_prepared_statements = prepared_statements()
+
+
 class table(object):
     _insert = insert_local()
+    _identity = identity_local()
+    _loader = loader_local()
+    # Set on the classes mro builds so rows read from the database can skip __init__
+    _column_defaults = None
+    _result_cache = None
 
     @classmethod
     def _register(cls):
@@ -46,8 +370,71 @@ class table(object):
             if isinstance(value, mro.foreign_keys.foreign_key_data_type):
                 foreign_keys.append(value)
         cls._get_value_on_insert_columns = [d.name for d in data_types if d.get_value_on_insert]
-        cls._get_value_on_insert_columns_str = ', '.join(cls._get_value_on_insert_columns)
         cls._primary_key_columns = [d.name for d in data_types if d.is_primary_key]
+        cls._column_names = [d.name for d in sorted(data_types + [f.data_type for f in foreign_keys],
+                                                    key=lambda d: d.column_index)]
+        cls._hydrators = {}
+        cls._compact_classes = {}
+        cls._namedtuple_classes = {}
+        cls._deferred_columns = []
+        # row -> the deferred_batch it was selected in, kept out of the rows' __dict__ which only holds column values
+        cls._deferred_batches = weakref.WeakKeyDictionary()
+        cls._result_cache = None
+        cls._build_sql()
+
+    @classmethod
+    def _build_sql(cls):
+        # The sql for the statements every table has is built once here, and again if the deferred columns change,
+        # so calls only need to add their where clause. Inserts and updates are kept for each set of columns used.
+        cls._select_sql = "select {} from \"{}\"".format(cls._get_select_list(None), cls.__name__)
+        cls._select_count_sql = "select count(*) from \"{}\"".format(cls.__name__)
+        cls._delete_sql = "delete from \"{}\"".format(cls.__name__)
+        cls._insert_statements = {}
+        cls._update_statements = {}
+        cls._get_sql = None
+        cls._delete_row_sql = None
+        if cls._primary_key_columns:
+            # the columns are named so the statement still works if columns are added to the table later
+            select_list = cls._get_select_list([c for c in cls._column_names if c not in cls._deferred_columns])
+            where = " and ".join(f'"{c}" = ${index + 1}' for index, c in enumerate(cls._primary_key_columns))
+            cls._get_sql = "select {} from \"{}\" where {}".format(select_list, cls.__name__, where)
+            cls._delete_row_sql = "delete from \"{}\" where {}".format(cls.__name__, where)
+
+    # Inserts and row updates are run as prepared statements so use $1 style parameters
+
+    @classmethod
+    def _get_insert_sql(cls, columns):
+        sql = cls._insert_statements.get(columns)
+        if sql is None:
+            if columns:
+                sql = "insert into \"{}\" ({}) values ({})".format(
+                    cls.__name__, ', '.join(f'"{c}"' for c in columns), ', '.join(f'${i + 1}' for i in range(len(columns))))
+            else:
+                sql = "insert into \"{}\" default values".format(cls.__name__)
+            if cls._get_value_on_insert_columns:
+                sql += " returning {}".format(', '.join(f'"{c}"' for c in cls._get_value_on_insert_columns))
+            cls._cache_sql(cls._insert_statements, columns, sql)
+        return sql
+
+    @classmethod
+    def _get_update_sql(cls, columns, match_columns, prepared):
+        key = (columns, match_columns, prepared)
+        sql = cls._update_statements.get(key)
+        if sql is None:
+            parameters = itertools.count(1)
+            parameter = (lambda: f'${next(parameters)}') if prepared else (lambda: '%s')
+            sql = "update \"{}\" set {} where {}".format(
+                cls.__name__, ', '.join(f'"{c}" = {parameter()}' for c in columns),
+                ' and '.join(f'"{c}" = {parameter()}' for c in match_columns))
+            cls._cache_sql(cls._update_statements, key, sql)
+        return sql
+
+    @staticmethod
+    def _cache_sql(statements, key, sql):
+        # Tables are usually written with only a few sets of columns, if something is generating more start again
+        if len(statements) >= SQL_CACHE_SIZE:
+            statements.clear()
+        statements[key] = sql
 
     @classmethod
     def _get_cursor(cls):
@@ -95,6 +482,177 @@ class table(object):
                 retry_count += 1
             return cursor
 
+    @classmethod
+    def _execute_prepared(cls, sql, values):
+        # Like _execute_sql but runs sql, which uses $1 style parameters, as a statement prepared on the connection
+        with psycopg2_lock:
+            retry_count = 0
+            while True:
+                try:
+                    cursor = cls._get_cursor()
+                    cursor.execute(_prepared_statements.get(cursor, sql, len(values)), values)
+                    con.connection.commit()
+                    return cursor
+                except psycopg2.InterfaceError:
+                    if retry_count == MAX_ATTEMPTS:
+                        raise
+                    logger.exception("Connection failure will attempt to reconnect [{}] {}".format(sql, values))
+                    time.sleep(retry_count * 1)
+                    con.reconnect()
+                except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.FeatureNotSupported) as e:
+                    # the statement has gone from the server, e.g. after a discard all, or the table has changed
+                    # since it was prepared, so prepare it again
+                    con.connection.rollback()
+                    name = _prepared_statements.discard(sql)
+                    if retry_count == MAX_ATTEMPTS:
+                        raise
+                    if isinstance(e, psycopg2.errors.FeatureNotSupported) and name is not None:
+                        cursor.execute(f"deallocate {name}")
+                        con.connection.commit()
+                except Exception:
+                    logger.exception("Exception while executing sql [{}] {}".format(sql, values))
+                    try:
+                        con.connection.rollback()
+                    except psycopg2.InterfaceError:
+                        logger.exception("Connection failure on attempt to rollback [{}] {}".format(sql, values))
+                    raise
+                retry_count += 1
+
+    @classmethod
+    def _execute_write(cls, sql, values=None, cursor=None, prepared=False, keep_identity_map=False):
+        # The result cache is cleared even if the write fails as it may have been committed before the error.
+        # Inserts and writes to a single row keep the identity map right themselves, anything else could have
+        # changed any row so the table's rows are dropped from it to be read again.
+        try:
+            if prepared:
+                return cls._execute_prepared(sql, values)
+            return cls._execute_sql(sql, values, cursor)
+        finally:
+            cls._clear_result_cache()
+            if not keep_identity_map:
+                cls._clear_identity_map()
+            if table._loader.loader is not None:
+                table._loader.loader.forget(cls)
+
+    @classmethod
+    def _create_objects(cls, description, rows, compact=False, as_=None):
+        column_names = tuple(column.name for column in description)
+
+        # Plain values for read paths that don't need table objects
+        if as_ is not None:
+            if as_ == 'tuple':
+                return list(rows)
+            if as_ == 'dict':
+                return [dict(zip(column_names, row)) for row in rows]
+            if as_ == 'namedtuple':
+                namedtuple_class = cls._namedtuple_classes.get(column_names)
+                if namedtuple_class is None:
+                    type_name = f"{cls.__name__}_row" if cls.__name__.isidentifier() else 'row'
+                    namedtuple_class = collections.namedtuple(type_name, column_names, rename=True)
+                    cls._namedtuple_classes[column_names] = namedtuple_class
+                return list(map(namedtuple_class._make, rows))
+
+        if compact:
+            compact_class = cls._compact_classes.get(column_names)
+            if compact_class is None:
+                compact_class = cls._create_compact_class(column_names)
+                cls._compact_classes[column_names] = compact_class
+            new = tuple.__new__
+            return [new(compact_class, row) for row in rows]
+
+        if cls._column_defaults is None:
+            with disable_insert():
+                return [cls(**dict(zip(column_names, row))) for row in rows]
+
+        hydrator = cls._hydrators.get(column_names)
+        if hydrator is None:
+            hydrator = cls._compile_hydrator(column_names)
+            cls._hydrators[column_names] = hydrator
+        objs = hydrator(rows)
+
+        if table._identity.map is not None and cls._primary_key_columns:
+            objs = cls._use_identity_map(objs, column_names)
+
+        # Rows missing some columns share a batch so that using a missing column loads it for all of them at once
+        if len(objs) > 1 and len(cls._primary_key_columns) == 1 and len(column_names) < len(cls._column_names):
+            batch = deferred_batch(cls, objs)
+            deferred_batches = cls._deferred_batches
+            for obj in objs:
+                deferred_batches[obj] = batch
+
+        # So the foreign keys of all these rows can be followed together, see batch_loads
+        if table._loader.loader is not None and len(objs) > 1:
+            table._loader.loader.add_rows(objs)
+        return objs
+
+    @classmethod
+    def _use_identity_map(cls, objs, column_names):
+        identity_map = table._identity.map
+        primary_key_columns = cls._primary_key_columns
+        for index, obj in enumerate(objs):
+            key = (cls, tuple(obj.__dict__[c] for c in primary_key_columns))
+            existing = identity_map.get(key)
+            if existing is None:
+                identity_map[key] = obj
+            else:
+                # keep the object already in use but bring the columns just read up to date
+                existing_state = existing.__dict__
+                state = obj.__dict__
+                for column_name in column_names:
+                    existing_state[column_name] = state[column_name]
+                objs[index] = existing
+        return objs
+
+    @classmethod
+    def _get_from_identity_map(cls, *primary_key_values):
+        if table._identity.map is None:
+            return None
+        return table._identity.map.get((cls, primary_key_values))
+
+    @classmethod
+    def _remove_from_identity_map(cls, obj):
+        if table._identity.map is not None and cls._primary_key_columns:
+            table._identity.map.pop((cls, tuple(obj.__dict__[c] for c in cls._primary_key_columns)), None)
+
+    @classmethod
+    def _clear_identity_map(cls):
+        identity_map = table._identity.map
+        if identity_map is not None:
+            for key in [key for key in identity_map.keys() if key[0] is cls]:
+                identity_map.pop(key, None)
+
+    @classmethod
+    def _compile_hydrator(cls, column_names):
+        # Rows from the database have already been converted by psycopg2 and need no insert, so rather than
+        # going through __init__ build a function that puts each row straight into a new instance's __dict__.
+        # Columns that weren't selected are left out and loaded if they are used, see _load_missing_columns.
+        for column_name in column_names:
+            if not hasattr(cls, column_name):
+                raise ValueError(f"{cls.__name__} does not have an attribute {column_name}")
+
+        state = ', '.join(f'{column_name!r}: row[{index}]' for index, column_name in enumerate(column_names))
+        source = (f"def hydrate(rows):\n"
+                  f"    objs = []\n"
+                  f"    append = objs.append\n"
+                  f"    for row in rows:\n"
+                  f"        obj = new(cls)\n"
+                  f"        obj.__dict__ = {{{state}}}\n"
+                  f"        append(obj)\n"
+                  f"    return objs\n")
+        namespace = {'new': object.__new__, 'cls': cls}
+        exec(source, namespace)
+        return namespace['hydrate']
+
+    @classmethod
+    def _create_compact_class(cls, column_names):
+        for column_name in column_names:
+            if not hasattr(cls, column_name):
+                raise ValueError(f"{cls.__name__} does not have an attribute {column_name}")
+        attributes = {'__slots__': (), '_column_names': column_names, '_table_class': cls}
+        for index, column_name in enumerate(column_names):
+            attributes[column_name] = mro.data_types.compact_column(column_name, index)
+        return type(cls.__name__, (compact_row,), attributes)
+
     @staticmethod
     def _convert_numpy_types_to_python(values):
         for k, v in values.items():
@@ -102,101 +660,474 @@ class table(object):
         return values
 
     @classmethod
-    @retry(wait=wait_random_exponential(), stop=stop_after_attempt(MAX_ATTEMPTS),
-           reraise=True, before_sleep=before_sleep_log(logger, logging.WARNING))
-    def select(cls, clause=None, *format_args):
+    @cached_result
+    def select(cls, clause=None, *format_args, columns=None, defer=None, compact=False, as_=None):
+        cls._check_row_type(compact, as_)
         format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
+        if columns is None and defer is None:
+            sql = cls._select_sql
+        else:
+            sql = "select {} from \"{}\"".format(cls._get_select_list(columns, defer), cls.__name__)
 
         if clause is None:
-            sql = "select * from \"{}\";".format(cls.__name__)
+            sql = f"{sql};"
         else:
-            sql = "select * from \"{}\" where {};".format(cls.__name__, clause)
-        cursor = cls._execute_sql(sql, values=format_args)
-
-        column_names = [column.name for column in cursor.description]
-
-        with disable_insert():
-            objs = []
-            for row in cursor:
-                kwargs = {}
-                for index in range(len(column_names)):
-                    kwargs[column_names[index]] = row[index]
-                objs.append(cls(**kwargs))
-        return objs
+            sql = f"{sql} where {clause};"
+        description, rows = cls._select_rows(sql, format_args)
+
+        return cls._create_objects(description, rows, compact, as_)
+
+    @classmethod
+    def select_page(cls, clause=None, *format_args, order_by=None, after=None, limit=100, columns=None, defer=None,
+                    compact=False, as_=None):
+        # The arguments are all checked here, before the retried part, so bad ones fail straight away
+        if limit < 1:
+            raise ValueError(f"limit should be at least 1 not {limit}")
+        cls._check_row_type(compact, as_)
+        format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
+        order_by = cls._get_page_order(order_by)
+
+        # Keyset pagination, rather than skipping rows with offset start from the key of the last row
+        # of the previous page so an index on the order by columns makes every page equally quick
+        clauses = [] if clause is None else [f"({clause})"]
+        values = list(format_args)
+        if after is not None:
+            if not isinstance(after, (tuple, list)):
+                after = (after,)
+            if len(after) != len(order_by):
+                raise ValueError(f"after should have a value for each of the order by columns {order_by}")
+            after_clause, after_values = cls._get_page_after(
+                order_by, [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in after])
+            clauses.append(after_clause)
+            values.extend(after_values)
+
+        if columns is not None:
+            columns = cls._check_columns(columns)
+            columns += [c for c in order_by if c not in columns]
+        elif defer is not None:
+            defer = [c for c in cls._check_columns(defer) if c not in order_by]
+        elif cls._deferred_columns:
+            defer = [c for c in cls._deferred_columns if c not in order_by]
+        sql = "select {} from \"{}\"".format(cls._get_select_list(columns, defer), cls.__name__)
+        if clauses:
+            sql += " where {}".format(' and '.join(clauses))
+        # one extra row tells us whether there is another page
+        sql += " order by {} limit %s;".format(', '.join(f'"{c}"' for c in order_by))
+        values.append(limit + 1)
+
+        description, rows = cls._select_rows(sql, values)
+
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            column_names = [column.name for column in description]
+            next_after = tuple(rows[-1][column_names.index(c)] for c in order_by)
+        return page(cls._create_objects(description, rows, compact, as_), next_after)
+
+    @classmethod
+    def select_pages(cls, clause=None, *format_args, order_by=None, after=None, limit=100, columns=None, defer=None,
+                     compact=False, as_=None):
+        while True:
+            objs = cls.select_page(clause, *format_args, order_by=order_by, after=after, limit=limit,
+                                   columns=columns, defer=defer, compact=compact, as_=as_)
+            if objs:
+                yield objs
+            if objs.after is None:
+                return
+            after = objs.after
+
+    @staticmethod
+    def _check_row_type(compact, as_):
+        if as_ not in (None, 'tuple', 'namedtuple', 'dict'):
+            raise ValueError(f"as_ should be 'tuple', 'namedtuple' or 'dict' not {as_!r}")
+        if compact and as_ is not None:
+            raise ValueError(f"compact rows can't also be returned as {as_!r}, use one or the other")
 
     @classmethod
     @retry(wait=wait_random_exponential(), stop=stop_after_attempt(MAX_ATTEMPTS),
            reraise=True, before_sleep=before_sleep_log(logger, logging.WARNING))
-    def select_count(cls, clause=None, *format_args):
+    def _select_rows(cls, sql, values):
+        cursor = cls._execute_sql(sql, values=values)
+        return cursor.description, cursor.fetchall()
+
+    @classmethod
+    def _get_page_order(cls, order_by):
+        if order_by is None:
+            if not cls._primary_key_columns:
+                raise ValueError("Paging needs columns to order by, is your table missing a primary key?")
+            return list(cls._primary_key_columns)
+        order_by = cls._check_columns(order_by)
+        # the primary key breaks ties so rows with the same values in the order by columns aren't skipped between pages
+        return order_by + [c for c in cls._primary_key_columns if c not in order_by]
+
+    @classmethod
+    def _get_page_after(cls, order_by, after):
+        # The rows which sort after the key of the last row of the previous page. When none of the columns can be
+        # null a row comparison does it and can use an index, otherwise it is written out a column at a time
+        # with nulls sorting last, as they do in postgres' default order.
+        if None not in after and all(cls._get_data_type(c).not_null or c in cls._primary_key_columns for c in order_by):
+            return "({}) > ({})".format(', '.join(f'"{c}"' for c in order_by), ', '.join(['%s'] * len(after))), list(after)
+
+        alternatives = []
+        values = []
+        for index, column_name in enumerate(order_by):
+            # nothing sorts after a null
+            if after[index] is None:
+                continue
+            conditions = []
+            for previous_column_name, value in zip(order_by[:index], after[:index]):
+                if value is None:
+                    conditions.append(f'"{previous_column_name}" is null')
+                else:
+                    conditions.append(f'"{previous_column_name}" = %s')
+                    values.append(value)
+            conditions.append(f'("{column_name}" > %s or "{column_name}" is null)')
+            values.append(after[index])
+            alternatives.append(' and '.join(conditions))
+        if not alternatives:
+            return "false", []
+        return "({})".format(' or '.join(f'({a})' for a in alternatives)), values
+
+    @classmethod
+    def _check_columns(cls, columns):
+        # Column names end up in the sql so only allow the ones the table really has
+        if isinstance(columns, str):
+            columns = [columns]
+        for column_name in columns:
+            if not isinstance(getattr(cls, column_name, None),
+                              (mro.data_types.database_type, mro.foreign_keys.foreign_key_data_type)):
+                raise ValueError(f"{cls.__name__} does not have a column {column_name}")
+        return list(columns)
+
+    @classmethod
+    def set_deferred_columns(cls, *column_names):
+        # Columns left out of selects on this table by default, e.g. large json or bytea columns which are rarely used
+        deferred_columns = [c for c in cls._check_columns(list(column_names)) if c not in cls._primary_key_columns]
+        if deferred_columns and not cls._primary_key_columns:
+            raise ValueError("Deferring columns needs a primary key to load them with, is your table missing one?")
+        cls._deferred_columns = deferred_columns
+        cls._build_sql()
+        cls._clear_result_cache()
+
+    @classmethod
+    def enable_result_cache(cls, max_size=1000, ttl=60):
+        # Keeps the results of select, select_one and select_count on this table, for tables which are read far
+        # more than they are written. Writes through mro clear it but other writers are only seen after ttl seconds.
+        cls._result_cache = result_cache(max_size, ttl)
+
+    @classmethod
+    def disable_result_cache(cls):
+        cls._result_cache = None
+
+    @classmethod
+    def _copy_settings(cls, previous):
+        # Called on a class rebuilt after the schema changed with the class it replaces, so the deferred columns
+        # that still exist and the result cache, emptied as the rows may have changed, carry on being used
+        deferred_columns = [c for c in previous._deferred_columns if c in cls._column_names]
+        if deferred_columns and cls._primary_key_columns:
+            cls.set_deferred_columns(*deferred_columns)
+        if previous._result_cache is not None:
+            cls.enable_result_cache(previous._result_cache.max_size, previous._result_cache.ttl)
+
+    @classmethod
+    def _clear_result_cache(cls):
+        if cls._result_cache is not None:
+            cls._result_cache.clear()
+
+    @classmethod
+    def _get_select_list(cls, columns, defer=None):
+        if columns is None:
+            deferred_columns = cls._deferred_columns if defer is None else cls._check_columns(defer)
+            if not deferred_columns:
+                return '*'
+            columns = [c for c in cls._column_names if c not in deferred_columns]
+        columns = cls._check_columns(columns)
+        if not cls._primary_key_columns and set(columns) != set(cls._column_names):
+            raise ValueError("Selecting only some columns needs a primary key to load the rest with, is your table missing one?")
+        # Always fetch the primary key so the rest of the columns can be loaded later and the rows updated
+        columns = cls._primary_key_columns + [c for c in columns if c not in cls._primary_key_columns]
+        return ', '.join(f'"{c}"' for c in columns)
+
+    def _load_missing_columns(self, column_name):
+        # Called when a column that wasn't selected is used, loads all the missing columns in one go
+        cls = self.__class__
+        batch = cls._deferred_batches.pop(self, None)
+        if batch is not None:
+            batch.load()
+
+        missing_columns = [c for c in cls._column_names if c not in self.__dict__]
+        primary_key_columns = cls._primary_key_columns
+        if not missing_columns:
+            return
+        if not primary_key_columns:
+            raise AttributeError(f"{cls.__name__} row was read without {column_name} and has no primary key to load it with.")
+        primary_key_column_values = [self.__dict__[c] for c in primary_key_columns]
+        sql = "select {} from \"{}\" where {};".format(
+            ', '.join(f'"{c}"' for c in missing_columns), cls.__name__,
+            ' and '.join(f'"{c}" = %s' for c in primary_key_columns))
+
+        cursor = cls._execute_sql(sql, values=primary_key_column_values)
+        row = cursor.fetchone()
+        if row is None:
+            raise LookupError(f"{cls.__name__} row {primary_key_column_values} no longer exists to load its columns from.")
+        for column_name, value in zip(missing_columns, row):
+            self.__dict__[column_name] = value
+
+    @classmethod
+    def select_iter(cls, clause=None, *format_args, batch_size=1000, columns=None, defer=None, compact=False,
+                    as_=None):
+        # Not a generator itself so the arguments are checked when it is called rather than when iterating starts
+        cls._check_row_type(compact, as_)
         format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
+        select_list = cls._get_select_list(columns, defer)
 
         if clause is None:
-            sql = "select count(*) from \"{}\";".format(cls.__name__)
+            sql = "select {} from \"{}\";".format(select_list, cls.__name__)
         else:
-            sql = "select count(*) from \"{}\" where {};".format(cls.__name__, clause)
+            sql = "select {} from \"{}\" where {};".format(select_list, cls.__name__, clause)
+        return cls._iter_rows(sql, format_args, batch_size, compact, as_)
 
-        cursor = cls._execute_sql(sql, values=format_args)
+    @classmethod
+    def _iter_rows(cls, sql, format_args, batch_size, compact, as_):
+        for description, rows in cls._stream_rows(sql, format_args, batch_size):
+            yield from cls._create_objects(description, rows, compact, as_)
 
-        for row in cursor:
-            return row[0]
+    @staticmethod
+    def _stream_rows(sql, values, batch_size):
+        # The select runs through a server side cursor on a connection of its own, in a transaction left open until
+        # the generator is finished with, so postgres produces the rows a batch at a time as they are fetched and
+        # only one batch is held in memory. The shared connection is left free so the rows can be used, e.g. updated,
+        # as they come. If the connection drops part way through the error is raised rather than starting again.
+        connection = con.connection_function()
+        try:
+            mro.custom_types.register_custom_types(connection)
+            cursor = connection.cursor(f'mro_{uuid.uuid4().hex}')
+            cursor.execute(sql, values)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield cursor.description, rows
+        finally:
+            connection.close()
 
     @classmethod
+    def select_arrays(cls, clause=None, *format_args, columns=None, batch_size=100000):
+        format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
+        columns = cls._column_names if columns is None else cls._check_columns(columns)
+        data_type_names, dtypes, masked = cls._get_numpy_types(columns)
+        select_list = ', '.join(mro.data_types.numpy_select_map.get(name, '"{}"').format(c)
+                                for c, name in zip(columns, data_type_names))
+
+        if clause is None:
+            sql = "select {} from \"{}\";".format(select_list, cls.__name__)
+        else:
+            sql = "select {} from \"{}\" where {};".format(select_list, cls.__name__, clause)
+
+        # Straight from batches of rows to an array per column, without creating any table objects
+        column_batches = [[] for c in columns]
+        for description, rows in cls._stream_rows(sql, format_args, batch_size):
+            for batches, dtype, column_masked, values in zip(column_batches, dtypes, masked, zip(*rows)):
+                batches.append(mro.data_types.convert_python_to_numpy(values, dtype, column_masked))
+
+        return {column_name: mro.data_types.concatenate_numpy(batches, dtype, column_masked)
+                for column_name, dtype, column_masked, batches in zip(columns, dtypes, masked, column_batches)}
+
+    @classmethod
+    def select_frame(cls, clause=None, *format_args, columns=None, batch_size=100000):
+        arrays = cls.select_arrays(clause, *format_args, columns=columns, batch_size=batch_size)
+        return cls._create_frame(arrays)
+
+    @classmethod
+    def copy_out_batches(cls, clause=None, *format_args, columns=None, batch_size=100000):
+        format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
+        columns = cls._column_names if columns is None else cls._check_columns(columns)
+        data_type_names, dtypes, masked = cls._get_numpy_types(columns)
+        select_list = mro.binary_copy.get_select_list(columns, data_type_names)
+
+        if clause is None:
+            sql = "select {} from \"{}\"".format(select_list, cls.__name__)
+        else:
+            sql = "select {} from \"{}\" where {}".format(select_list, cls.__name__, clause)
+
+        return mro.binary_copy.copy_out_batches(sql, format_args, columns, data_type_names, masked, batch_size)
+
+    @classmethod
+    def copy_out_arrays(cls, clause=None, *format_args, columns=None, batch_size=100000):
+        columns = cls._column_names if columns is None else cls._check_columns(columns)
+        column_batches = {c: [] for c in columns}
+        for arrays in cls.copy_out_batches(clause, *format_args, columns=columns, batch_size=batch_size):
+            for column_name, array in arrays.items():
+                column_batches[column_name].append(array)
+
+        data_type_names, dtypes, masked = cls._get_numpy_types(columns)
+        return {column_name: mro.data_types.concatenate_numpy(column_batches[column_name], dtype, column_masked)
+                for column_name, dtype, column_masked in zip(columns, dtypes, masked)}
+
+    @classmethod
+    def copy_out_frame(cls, clause=None, *format_args, columns=None, batch_size=100000):
+        arrays = cls.copy_out_arrays(clause, *format_args, columns=columns, batch_size=batch_size)
+        return cls._create_frame(arrays)
+
+    @classmethod
+    def _get_numpy_types(cls, columns):
+        # The numpy dtype of each column and whether it is masked only depend on the column, so every batch agrees
+        data_types = [cls._get_data_type(c) for c in columns]
+        data_type_names = [data_type.__class__.__name__ for data_type in data_types]
+        dtypes = [mro.data_types.numpy_type_map.get(name, 'object') for name in data_type_names]
+        masked = [dtype in mro.data_types.masked_numpy_types and not data_type.not_null
+                  for dtype, data_type in zip(dtypes, data_types)]
+        return data_type_names, dtypes, masked
+
+    @staticmethod
+    def _create_frame(arrays):
+        import numpy
+        import pandas
+
+        columns = {}
+        for column_name, array in arrays.items():
+            if isinstance(array, numpy.ma.MaskedArray):
+                # pandas' nullable integer and boolean types keep the values as they are, with the nulls as NA
+                array_type = pandas.arrays.BooleanArray if array.dtype == bool else pandas.arrays.IntegerArray
+                array = array_type(array.data, numpy.ma.getmaskarray(array))
+            columns[column_name] = array
+        return pandas.DataFrame(columns, columns=list(arrays))
+
+    @classmethod
+    def _get_data_type(cls, column_name):
+        data_type = getattr(cls, column_name)
+        if isinstance(data_type, mro.foreign_keys.foreign_key_data_type):
+            data_type = data_type.data_type
+        return data_type
+
+    @classmethod
+    @cached_result
     @retry(wait=wait_random_exponential(), stop=stop_after_attempt(MAX_ATTEMPTS),
            reraise=True, before_sleep=before_sleep_log(logger, logging.WARNING))
-    def select_one(cls, clause=None, *format_args):
+    def select_count(cls, clause=None, *format_args):
+        if clause is None:
+            cursor = cls._execute_prepared(cls._select_count_sql, ())
+        else:
+            # the clause isn't prepared as postgres would then convert the values to the types it infers from the
+            # clause rather than using the values as they are, e.g. comparing an integer column to 1.5 would use 2
+            format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
+            cursor = cls._execute_sql(f"{cls._select_count_sql} where {clause};", values=format_args)
+
+        for row in cursor:
+            return row[0]
+
+    @classmethod
+    @cached_result
+    def select_one(cls, clause=None, *format_args, columns=None, defer=None, as_=None):
+        cls._check_row_type(False, as_)
         format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
+        if columns is None and defer is None:
+            sql = cls._select_sql
+        else:
+            sql = "select {} from \"{}\"".format(cls._get_select_list(columns, defer), cls.__name__)
+
         if clause is None:
-            sql = "select * from \"{}\" limit 1;".format(cls.__name__)
+            sql = f"{sql} limit 1;"
         else:
-            sql = "select * from \"{}\" where {} limit 1;".format(cls.__name__, clause)
+            sql = f"{sql} where {clause} limit 1;"
 
-        cursor = cls._execute_sql(sql, values=format_args)
+        description, rows = cls._select_rows(sql, format_args)
 
-        column_names = [column.name for column in cursor.description]
+        objs = cls._create_objects(description, rows, as_=as_)
+        return objs[0] if objs else None
 
-        obj = None
+    @classmethod
+    def get(cls, *primary_key_values):
+        # The quickest way to read one row, by its primary key, which is None if there isn't one
+        if cls._get_sql is None:
+            raise ValueError("Get needs a primary key, is your table missing one?")
+        primary_key_values = tuple(x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in primary_key_values)
+        if len(primary_key_values) != len(cls._primary_key_columns):
+            raise ValueError(f"Get needs a value for each of the primary key columns {cls._primary_key_columns}")
 
-        with disable_insert():
-            for row in cursor:
-                kwargs = {}
-                for index in range(len(column_names)):
-                    kwargs[column_names[index]] = row[index]
-                obj = cls(**kwargs)
+        obj = cls._get_from_identity_map(*primary_key_values)
+        if obj is not None:
+            return obj
 
-        return obj
+        # in a batch_loads block anything queued is loaded along with this row
+        if table._loader.loader is not None:
+            return table._loader.loader.load(cls, primary_key_values[0] if len(primary_key_values) == 1 else primary_key_values)
+
+        cursor = cls._execute_prepared(cls._get_sql, primary_key_values)
+        objs = cls._create_objects(cursor.description, cursor)
+        return objs[0] if objs else None
+
+    @classmethod
+    def get_many(cls, keys, column=None, batch_size=10000):
+        # Reads the rows for a list of keys in as few queries as possible, returned in the same order as the keys
+        # with None where there isn't a row. Keys are primary key values, tuples of them for a composite key,
+        # or values of column when it is given, in which case the first row found for each value is returned.
+        if column is None:
+            if not cls._primary_key_columns:
+                raise ValueError("Get many needs a primary key or a column, is your table missing a primary key?")
+            key_columns = cls._primary_key_columns
+        else:
+            key_columns = cls._check_columns(column)
+
+        if len(key_columns) == 1:
+            keys = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in keys]
+            where = "\"{}\" = any(%s)".format(key_columns[0])
+        else:
+            # psycopg2 sends a tuple of tuples as a list of rows, which postgres casts to the column types
+            keys = [tuple(x) for x in keys]
+            where = "({}) in %s".format(', '.join(f'"{c}"' for c in key_columns))
+
+        found = {}
+        if column is None and table._identity.map is not None:
+            for key in keys:
+                obj = cls._get_from_identity_map(*(key if len(key_columns) > 1 else (key,)))
+                if obj is not None:
+                    found[key] = obj
+        missing_keys = [key for key in dict.fromkeys(keys) if key not in found and key is not None]
+        if not missing_keys:
+            return [found.get(key) for key in keys]
+
+        select_list = cls._get_select_list([c for c in cls._column_names if c not in cls._deferred_columns or c in key_columns])
+        sql = "select {} from \"{}\" where {};".format(select_list, cls.__name__, where)
+        for start in range(0, len(missing_keys), batch_size):
+            batch = missing_keys[start:start + batch_size]
+            cursor = cls._execute_sql(sql, values=[batch if len(key_columns) == 1 else tuple(batch)])
+            for obj in cls._create_objects(cursor.description, cursor):
+                if len(key_columns) == 1:
+                    key = obj.__dict__[key_columns[0]]
+                else:
+                    key = tuple(obj.__dict__[c] for c in key_columns)
+                found.setdefault(key, obj)
+        return [found.get(key) for key in keys]
 
     @classmethod
     def delete(cls, clause=None, *format_args):
         format_args = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in format_args]
         if clause is None:
-            sql = "delete from \"{}\";".format(cls.__name__)
+            sql = f"{cls._delete_sql};"
         else:
-            sql = "delete from \"{}\" where {};".format(cls.__name__, clause)
+            sql = f"{cls._delete_sql} where {clause};"
 
-        cls._execute_sql(sql, values=format_args)
+        cls._execute_write(sql, values=format_args)
+
+    @classmethod
+    def _delete_row(cls, primary_key_values):
+        cls._execute_write(cls._delete_row_sql, primary_key_values, prepared=True, keep_identity_map=True)
 
     @classmethod
     def insert(cls, **kwargs):
         if table._insert.disabled:
             return
 
-        keys = kwargs.keys()
-        if len(keys) == 0:
-            cols = 'default'
-            vals_str = ''
-            vals = ()
-        else:
+        if kwargs:
             kwargs = table._convert_numpy_types_to_python(kwargs)
-            cols = '({})'.format(', '.join(keys))
             vals = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in kwargs.values()]
-            vals_str_list = ["%s"] * len(vals)
-            vals_str = ' ({})'.format(', '.join(vals_str_list))
-
-        if cls._get_value_on_insert_columns_str:
-            sql = "insert into \"{t}\" {c} values{v} returning {c2}".format(
-                t=cls.__name__, c=cols, v=vals_str, c2=cls._get_value_on_insert_columns_str)
+        else:
+            vals = ()
+        sql = cls._get_insert_sql(tuple(kwargs))
 
-            cursor = cls._execute_sql(sql, vals)
+        if cls._get_value_on_insert_columns:
+            cursor = cls._execute_write(sql, vals, prepared=True, keep_identity_map=True)
 
             with disable_insert():
                 for row in cursor:
@@ -204,10 +1135,7 @@ class table(object):
                         kwargs[cls._get_value_on_insert_columns[index]] = row[index]
                     obj = cls(**kwargs)
         else:
-            sql = "insert into \"{t}\" {c} values{v}".format(
-                t=cls.__name__, c=cols, v=vals_str)
-
-            cls._execute_sql(sql, vals)
+            cls._execute_write(sql, vals, prepared=True, keep_identity_map=True)
 
             with disable_insert():
                 obj = cls(**kwargs)
@@ -232,25 +1160,32 @@ class table(object):
         sql = "insert into \"{}\" ({}) values {}".format(
             cls.__name__, cols, aggregate_values)
 
-        cls._execute_sql(sql, cursor=cursor)
+        cls._execute_write(sql, cursor=cursor, keep_identity_map=True)
 
     @classmethod
     def update(cls, match_columns, match_column_values, **kwargs):
+        cls._update(match_columns, match_column_values, kwargs, prepared=False)
+
+    @classmethod
+    def _update_row(cls, primary_key_values, kwargs):
+        # A row is matched on its own primary key values so, unlike the values passed to update which postgres
+        # would convert to the type of the match columns, it is safe to run as a prepared statement
+        cls._update(cls._primary_key_columns, primary_key_values, kwargs, prepared=True)
+
+    @classmethod
+    def _update(cls, match_columns, match_column_values, kwargs, prepared):
         if table._insert.disabled:
             return
 
         if not match_columns:
             raise ValueError("Update needs columns to match to update, is your table missing a primary key?")
 
-        keys = list(kwargs.keys())
         vals = [x if not isinstance(x, mro.foreign_keys.foreign_key) else x.value for x in kwargs.values()]
-        vals = vals + match_column_values
-        update_column_str = ", ".join([c + '=%s' for c in keys])
-        match_column_str = " and ".join([c + '=%s' for c in match_columns])
-        sql = "update \"{t}\" set {c} where {c2}".format(
-            t=cls.__name__, c=update_column_str, c2=match_column_str)
+        vals = vals + list(match_column_values)
+        sql = cls._get_update_sql(tuple(kwargs), tuple(match_columns), prepared)
 
-        cls._execute_sql(sql, vals)
+        # only a row's own update is prepared and that row is the one in the identity map
+        cls._execute_write(sql, vals, prepared=prepared, keep_identity_map=prepared)
 
     @classmethod
     def update_many(cls, match_columns, match_column_values, update_columns, update_column_values):
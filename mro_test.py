@@ -1,4 +1,5 @@
 ﻿import os
+import sys
 import pytest
 import psycopg2
 import mro
@@ -67,6 +68,93 @@ class TestMro(object):
 
         mro.table3.insert(id=2)
 
+    def test_select_does_not_call_init(self, connection, monkeypatch):
+        def fail(self, **kwargs):
+            raise Exception('Rows from the database should not go through __init__')
+
+        monkeypatch.setattr(mro.table1, '__init__', fail)
+
+        tables = mro.table1.select('column1 = %s', 2)
+        assert len(tables) == 1
+        assert tables[0].column2 == 'Hellow World2!'
+        assert tables[0].column3 == 3
+
+        table = mro.table1.select_one('column1 = %s', 2)
+        table.column3 = 5
+        assert mro.table1.select_one('id = %s', table.id).column3 == 5
+
+        table.delete()
+        assert mro.table1.select_one('id = %s', table.id) is None
+
+    def test_compact_select(self, connection):
+        rows = mro.table2.select(compact=True)
+
+        assert len(rows) == 1
+        row = rows[0]
+        table2 = mro.table2.select_one()
+        assert row.column1 == table2.column1
+        assert row.column2 == table2.column2
+        assert row.to_dict() == {'id': table2.id, 'column1': table2.column1, 'column2': table2.column2, 'column3': table2.column3}
+        assert sys.getsizeof(row) == sys.getsizeof(tuple(row))
+        assert type(row) is type(mro.table2.select(compact=True)[0])
+
+        with pytest.raises(PermissionError):
+            row.column2 = 5
+
+        with pytest.raises(AttributeError):
+            row.update(column2=5)
+
+    def test_select_as(self, connection):
+        table2 = mro.table2.select_one()
+        values = (table2.id, table2.column1, table2.column2, table2.column3)
+
+        assert mro.table2.select(as_='tuple') == [values]
+
+        row = mro.table2.select_one(as_='namedtuple')
+        assert row == values
+        assert row.column2 == table2.column2
+        assert type(row) is type(mro.table2.select(as_='namedtuple')[0])
+
+        assert mro.table2.select(as_='dict', columns=['column3']) == [{'id': table2.id, 'column3': table2.column3}]
+
+    def test_select_as_checked_first(self, connection, monkeypatch):
+        statements = []
+        monkeypatch.setattr(mro.table2, '_execute_sql', lambda sql, *args, **kwargs: statements.append(sql))
+
+        # bad arguments fail before anything is run, rather than after a select that is then retried
+        with pytest.raises(ValueError):
+            mro.table2.select(as_='list')
+        with pytest.raises(ValueError):
+            mro.table2.select_one(as_='list')
+        with pytest.raises(ValueError):
+            mro.table2.select_iter(as_='list')
+        with pytest.raises(ValueError):
+            mro.table2.select_page(as_='list')
+        with pytest.raises(ValueError):
+            mro.table2.select(compact=True, as_='tuple')
+        assert statements == []
+
+    def test_sql_templates(self, connection, monkeypatch):
+        assert mro.table2._select_sql == 'select * from "table2"'
+        assert mro.table2._get_insert_sql(('column1', 'column2')) == \
+            'insert into "table2" ("column1", "column2") values ($1, $2) returning "id"'
+        assert mro.table2._get_update_sql(('column1',), ('id',), True) == 'update "table2" set "column1" = $1 where "id" = $2'
+        assert mro.table2._get_update_sql(('column1',), ('id',), False) == 'update "table2" set "column1" = %s where "id" = %s'
+
+        table2 = mro.table2.insert(column1='a', column2=1)
+        mro.table2.insert(column1='b', column2=2)
+        table2.update(column1='c', column2=3)
+        assert ('column1', 'column2') in mro.table2._insert_statements
+        assert (('column1', 'column2'), ('id',), True) in mro.table2._update_statements
+        assert mro.table2.select_one('id = %s', table2.id).column1 == 'c'
+        mro.table2.delete('id > %s', 1)
+
+        # the cached statements are limited
+        monkeypatch.setattr(mro.table, 'SQL_CACHE_SIZE', 2)
+        for columns in [('column1',), ('column2',), ('column3',)]:
+            mro.table2._get_insert_sql(columns)
+        assert len(mro.table2._insert_statements) <= 2
+
     def test_reconnect(self, connection):
         try:
             table = mro.table1.select_one()
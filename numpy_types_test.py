@@ -2,6 +2,9 @@ import pytest
 import mro
 import connection as con
 import pandas as pd
+import numpy as np
+import uuid
+from datetime import datetime, date, time
 
 
 @pytest.fixture
@@ -14,6 +17,8 @@ def connection_function(request):
     con.drop_tables()
 
     cursor.execute("create table table1 (id serial primary key, column1 integer default 1, column2 varchar(20), column3 float, column4 boolean)")
+    cursor.execute("create table table2 (id serial primary key, column1 timestamp, column2 date)")
+    cursor.execute("create table table3 (id serial primary key, column1 uuid, column2 time, column3 jsonb, column4 bytea, column5 real, column6 text)")
     connection.commit()
     connection.close()
 
@@ -42,3 +47,188 @@ def test_numpy_type_update(connection_function):
     t.column2 = df.iloc[i].values[1]
     t.column3 = df.iloc[i].values[2]
     t.column4 = df.iloc[i].values[3]
+
+
+def test_select_arrays(connection_function):
+    mro.load_database(connection_function)
+    mro.table1.insert_many(['column1', 'column2', 'column3', 'column4'],
+                           [[1, 'abc', 0.5, True], [2, 'bcd', 1.5, False], [3, 'cde', None, True]])
+
+    arrays = mro.table1.select_arrays("column1 > %s", 0, batch_size=2)
+
+    assert list(arrays) == ['id', 'column1', 'column2', 'column3', 'column4']
+    assert arrays['column1'].dtype == np.int64
+    assert arrays['column1'].tolist() == [1, 2, 3]
+    assert arrays['column2'].tolist() == ['abc', 'bcd', 'cde']
+    assert arrays['column3'].dtype == np.float64
+    assert np.isnan(arrays['column3'][2])
+    assert arrays['column4'].dtype == np.bool_
+
+
+def test_select_arrays_nulls_and_columns(connection_function):
+    mro.load_database(connection_function)
+    mro.table1.insert_many(['column1', 'column4'], [[None, None], [2, True]])
+
+    arrays = mro.table1.select_arrays(columns=['column1', 'column4'])
+
+    # nullable integers and booleans are masked rather than changing type, whether or not a batch has a null
+    assert list(arrays) == ['column1', 'column4']
+    assert arrays['column1'].dtype == np.int64
+    assert arrays['column1'].tolist() == [None, 2]
+    assert arrays['column4'].dtype == np.bool_
+    assert arrays['column4'].tolist() == [None, True]
+
+    arrays = mro.table1.select_arrays("column1 = %s", 2, columns=['id', 'column1'])
+    assert isinstance(arrays['column1'], np.ma.MaskedArray)
+    assert not isinstance(arrays['id'], np.ma.MaskedArray)
+
+
+def test_select_arrays_type_same_for_every_batch(connection_function):
+    mro.load_database(connection_function)
+    mro.table1.insert_many(['column1'], [[2 ** 31 - 1], [None]])
+
+    for arrays in [mro.table1.select_arrays(columns=['column1'], batch_size=1),
+                   mro.table1.copy_out_arrays(columns=['column1'], batch_size=1)]:
+        assert arrays['column1'].dtype == np.int64
+        assert arrays['column1'].tolist() == [2 ** 31 - 1, None]
+
+
+def test_select_frame(connection_function):
+    mro.load_database(connection_function)
+    mro.table1.insert_many(['column2', 'column3'], [['abc', 0.5], ['bcd', 1.5]])
+
+    df = mro.table1.select_frame(columns=['column2', 'column3'])
+
+    assert list(df.columns) == ['column2', 'column3']
+    assert df['column3'].sum() == 2.0
+
+    assert mro.table1.select_frame("column2 = %s", 'xyz').shape == (0, 5)
+
+    mro.table1.insert_many(['column1', 'column4'], [[None, None]])
+    df = mro.table1.select_frame(columns=['column1', 'column4'])
+    assert str(df['column1'].dtype) == 'Int64'
+    assert str(df['column4'].dtype) == 'boolean'
+    assert df['column1'].tolist() == [1, 1, pd.NA]
+
+
+def test_select_arrays_dates(connection_function):
+    mro.load_database(connection_function)
+    mro.table2.insert_many(['column1', 'column2'], [[datetime(2020, 1, 2, 3, 4, 5, 6), date(2020, 1, 2)], [None, None]])
+
+    arrays = mro.table2.select_arrays(columns=['column1', 'column2'])
+
+    assert arrays['column1'].dtype == np.dtype('datetime64[us]')
+    assert arrays['column1'][0] == np.datetime64('2020-01-02T03:04:05.000006')
+    assert np.isnat(arrays['column1'][1])
+    assert arrays['column2'].dtype == np.dtype('datetime64[D]')
+    assert arrays['column2'][0] == np.datetime64('2020-01-02')
+    assert np.isnat(arrays['column2'][1])
+
+
+def test_select_arrays_infinite_dates(connection_function):
+    mro.load_database(connection_function)
+    mro.execute_sql("insert into table2 (column1, column2) values ('infinity', '-infinity'), ('2020-01-02', '2020-01-02')")
+
+    arrays = mro.table2.select_arrays(columns=['column1', 'column2'])
+
+    # there is no datetime64 for infinity so it is NaT like a null
+    assert np.isnat(arrays['column1'][0])
+    assert np.isnat(arrays['column2'][0])
+    assert arrays['column2'][1] == np.datetime64('2020-01-02')
+
+
+def test_copy_out_arrays(connection_function):
+    mro.load_database(connection_function)
+    mro.table1.insert_many(['column1', 'column2', 'column3', 'column4'],
+                           [[1, 'abc', 0.5, True], [2, 'bcd', 1.5, False], [None, None, None, None]])
+    mro.table2.insert_many(['column1', 'column2'], [[datetime(2020, 1, 2, 3, 4, 5, 6), date(2020, 1, 2)], [None, None]])
+
+    for table in [mro.table1, mro.table2]:
+        copied = table.copy_out_arrays(batch_size=2)
+        selected = table.select_arrays()
+        assert list(copied) == list(selected)
+        for column_name in copied:
+            assert copied[column_name].dtype == selected[column_name].dtype
+            assert pd.Series(copied[column_name]).equals(pd.Series(selected[column_name]))
+
+
+def test_copy_out_arrays_other_types(connection_function):
+    mro.load_database(connection_function)
+    value = uuid.uuid4()
+    mro.table3.insert(column1=str(value), column2=time(1, 2, 3, 4), column3='{"a": 1}', column4=b'\x00\x01', column5=1.5, column6='abc')
+    mro.table3.insert()
+
+    arrays = mro.table3.copy_out_arrays()
+
+    assert arrays['column1'].tolist() == [value, None]
+    assert arrays['column2'].tolist() == [time(1, 2, 3, 4), None]
+    assert arrays['column3'].tolist() == ['{"a": 1}', None]
+    assert arrays['column4'].tolist() == [b'\x00\x01', None]
+    assert arrays['column5'][0] == 1.5
+    assert np.isnan(arrays['column5'][1])
+    assert arrays['column6'].tolist() == ['abc', None]
+
+
+def test_copy_out_arrays_infinite_dates(connection_function):
+    mro.load_database(connection_function)
+    mro.execute_sql("insert into table2 (column1, column2) values ('infinity', '-infinity'), ('-infinity', 'infinity'), ('2020-01-02', '2020-01-02')")
+
+    arrays = mro.table2.copy_out_arrays(columns=['column1', 'column2'])
+
+    assert np.isnat(arrays['column1'][:2]).all()
+    assert np.isnat(arrays['column2'][:2]).all()
+    assert arrays['column1'][2] == np.datetime64('2020-01-02T00:00:00')
+    assert arrays['column2'][2] == np.datetime64('2020-01-02')
+
+    # the same when the rows have to be decoded one at a time
+    batches = []
+    decoder = mro.binary_copy.binary_decoder(['column1', 'column2'], ['timestamp', 'date'], [False, False], 10, batches.append)
+    decoder._decode_columns = lambda rows: None
+    connection = connection_function()
+    connection.cursor().copy_expert('copy (select column1, column2 from table2 order by id) to stdout (format binary)', decoder)
+    connection.close()
+    decoder.flush()
+    assert np.isnat(batches[0]['column1'][:2]).all()
+    assert np.isnat(batches[0]['column2'][:2]).all()
+    assert batches[0]['column2'][2] == np.datetime64('2020-01-02')
+
+
+def test_copy_out_chunks_not_rows():
+    # the second chunk starts inside the first column's value, which looks like the start of a row
+    # but decoded from there has a partial utf-8 character, so the chunks must be found not to be rows first
+    value = b'\x00\x02\x00\x00\x00\x01\xc3\xa9'
+    row = b'\x00\x02' + b'\x00\x00\x00\x08' + value + b'\x00\x00\x00\x01' + b'x'
+    batches = []
+    decoder = mro.binary_copy.binary_decoder(['column1', 'column2'], ['text', 'text'], [False, False], 10, batches.append)
+    decoder.write(mro.binary_copy.HEADER + b'\x00' * 8)
+    decoder.write(row[:6])
+    decoder.write(row[6:])
+    decoder.write(b'\xff\xff')
+    decoder.flush()
+
+    assert batches[0]['column1'].tolist() == [value.decode('utf-8')]
+    assert batches[0]['column2'].tolist() == ['x']
+
+
+def test_copy_out_batches(connection_function):
+    mro.load_database(connection_function)
+    mro.table1.insert_many(['column1'], [[i] for i in range(10)])
+
+    batches = list(mro.table1.copy_out_batches("column1 >= %s", 3, columns=['column1'], batch_size=3))
+    assert [batch['column1'].tolist() for batch in batches] == [[3, 4, 5], [6, 7, 8], [9]]
+
+    batches = mro.table1.copy_out_batches(batch_size=2)
+    assert len(next(batches)['id']) == 2
+    batches.close()
+    assert mro.table1.select_count() == 10
+
+
+def test_copy_out_frame(connection_function):
+    mro.load_database(connection_function)
+    mro.table1.insert_many(['column2', 'column3'], [['abc', 0.5], ['bcd', 1.5]])
+
+    df = mro.table1.copy_out_frame(columns=['column2', 'column3'])
+
+    assert list(df.columns) == ['column2', 'column3']
+    assert df['column3'].sum() == 2.0
+    assert mro.table1.copy_out_frame("column2 = %s", 'xyz').shape == (0, 5)
@@ -82,6 +82,36 @@ def test_execute_sql_disconnected(connection):
     assert row_count == 3
 
 
+def test_reconnect_keeps_classes(connection):
+    table1 = mro.table1
+    mro.disconnect()
+    cursor = mro.execute_sql('select * from table1')
+    assert len(cursor.fetchall()) == 3
+    assert mro.table1 is table1
+
+
+def test_reconnect_reloads_changed_schema(connection):
+    mro.load_database(lambda: con.connect(), check_schema_on_reconnect=True)
+    table1 = mro.table1
+    mro.table1.set_deferred_columns('value')
+    mro.table1.enable_result_cache(max_size=10)
+
+    other_connection = con.connect()
+    cursor = other_connection.cursor()
+    cursor.execute("alter table table1 add column value2 integer default 7")
+    other_connection.commit()
+    other_connection.close()
+
+    mro.disconnect()
+    mro.execute_sql('select 1')
+
+    assert mro.table1 is not table1
+    assert mro.table1.select_one().value2 == 7
+    # the settings made on the old class are kept
+    assert mro.table1._deferred_columns == ['value']
+    assert mro.table1._result_cache.max_size == 10
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
     #pytest.main([__file__ + '::test_update_multiple_values'])
\ No newline at end of file
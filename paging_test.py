@@ -1 +1,180 @@
-# reminder to add tests for this and implement
\ No newline at end of file
+import psycopg2
+import pytest
+import mro
+import connection as con
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, column1 integer, column2 varchar(20), column1_label varchar(20))")
+    for i in range(25):
+        cursor.execute("insert into table1 (column1, column2, column1_label) values (%s, %s, %s)", (i, f'row {i}', str(i)))
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+
+    return lambda: con.connect()
+
+
+def record_connections(monkeypatch):
+    connections = []
+    connection_function = mro.connection.connection_function
+
+    def connect():
+        connections.append(connection_function())
+        return connections[-1]
+
+    monkeypatch.setattr(mro.connection, 'connection_function', connect)
+    return connections
+
+
+def test_select_iter(connection_function, monkeypatch):
+    connections = record_connections(monkeypatch)
+    tables = mro.table1.select_iter(batch_size=10)
+
+    assert not isinstance(tables, list)
+    tables = list(tables)
+    assert len(tables) == 25
+    assert all(isinstance(table, mro.table1) for table in tables)
+    assert sorted(table.column1 for table in tables) == list(range(25))
+    assert len(connections) == 1 and connections[0].closed
+
+
+def test_select_iter_with_clause(connection_function):
+    tables = list(mro.table1.select_iter("column1 >= %s", 20, batch_size=2))
+
+    assert sorted(table.column2 for table in tables) == [f'row {i}' for i in range(20, 25)]
+
+
+def test_select_iter_compact(connection_function):
+    rows = list(mro.table1.select_iter(batch_size=7, compact=True))
+
+    assert len(rows) == 25
+    assert isinstance(rows[0], tuple)
+
+
+def test_select_iter_update_while_iterating(connection_function):
+    for table in mro.table1.select_iter(batch_size=5):
+        table.column1 = table.column1 + 100
+
+    assert mro.table1.select_count("column1 >= 100") == 25
+
+
+def test_select_iter_streams(connection_function, monkeypatch):
+    connections = record_connections(monkeypatch)
+    tables = mro.table1.select_iter(batch_size=5)
+    next(tables)
+
+    # the cursor isn't held, which would have postgres run the whole select and store the result up front
+    cursor = connections[0].cursor()
+    cursor.execute("select is_holdable from pg_cursors")
+    assert cursor.fetchall() == [(False,)]
+
+    tables.close()
+    assert connections[0].closed
+
+
+def test_select_iter_connection_lost(connection_function, monkeypatch):
+    connections = record_connections(monkeypatch)
+    tables = mro.table1.select_iter(batch_size=5)
+    for i in range(5):
+        next(tables)
+
+    mro.execute_sql("select pg_terminate_backend(%s)", [connections[0].info.backend_pid])
+
+    with pytest.raises(psycopg2.OperationalError):
+        next(tables)
+
+    assert mro.table1.select_count() == 25
+
+
+def test_select_page(connection_function):
+    first = mro.table1.select_page(limit=10)
+
+    assert [table.id for table in first] == list(range(1, 11))
+    assert first.after == (10,)
+
+    second = mro.table1.select_page(after=first.after, limit=10)
+    assert [table.id for table in second] == list(range(11, 21))
+
+    last = mro.table1.select_page(after=second.after, limit=10)
+    assert [table.id for table in last] == list(range(21, 26))
+    assert last.after is None
+
+
+def test_select_page_with_clause_and_order(connection_function):
+    mro.table1.select_one("id = %s", 3).column1 = 100
+
+    tables = mro.table1.select_page("column1 < %s or column1 > %s", 2, 50, order_by=['column1', 'id'], limit=2)
+    assert [table.column1 for table in tables] == [0, 1]
+
+    tables = mro.table1.select_page("column1 < %s or column1 > %s", 2, 50, order_by=['column1', 'id'], after=tables.after, limit=2)
+    assert [table.column1 for table in tables] == [100]
+    assert tables.after is None
+
+
+def test_select_page_exact_fit(connection_function):
+    tables = mro.table1.select_page(after=20, limit=5)
+
+    assert len(tables) == 5
+    assert tables.after is None
+
+
+def test_select_page_unknown_column(connection_function):
+    with pytest.raises(ValueError):
+        mro.table1.select_page(order_by='column5; drop table table1')
+
+
+def test_select_page_limit(connection_function):
+    with pytest.raises(ValueError):
+        mro.table1.select_page(limit=0)
+
+
+def test_select_page_columns(connection_function):
+    tables = mro.table1.select_page(order_by='column1', limit=5, columns=['column2'])
+
+    assert [table.column2 for table in tables] == [f'row {i}' for i in range(5)]
+    assert set(tables[0].__dict__) == {'id', 'column1', 'column2'}
+    assert tables.after == (4, 5)
+
+    # a single column name is matched as a whole name, column1 is still needed for the order
+    tables = mro.table1.select_page(order_by='column1', limit=5, columns='column1_label')
+    assert set(tables[0].__dict__) == {'id', 'column1', 'column1_label'}
+    assert tables.after == (4, 5)
+
+
+def test_select_page_duplicates_and_nulls(connection_function):
+    mro.execute_sql("update table1 set column1 = id % 3 where id <= 20")
+    mro.execute_sql("update table1 set column1 = null where id > 20")
+
+    # the primary key is added to the order so rows with the same value aren't lost between pages
+    tables = [table for page in mro.table1.select_pages(order_by='column1', limit=4) for table in page]
+    ids = [table.id for table in tables]
+    assert ids == sorted(range(1, 26), key=lambda i: (i > 20, i % 3 if i <= 20 else 0, i))
+
+    tables = mro.table1.select_page(order_by='column1', after=(None, 22), limit=4)
+    assert [table.id for table in tables] == [23, 24, 25]
+    assert tables.after is None
+
+    with pytest.raises(ValueError):
+        mro.table1.select_page(order_by='column1', after=1)
+
+
+def test_select_pages(connection_function):
+    pages = list(mro.table1.select_pages(order_by='column2', limit=10))
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    column2s = [table.column2 for page in pages for table in page]
+    assert column2s == sorted(f'row {i}' for i in range(25))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,95 @@
+import pytest
+import mro
+import connection as con
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, name varchar(20) not null, value integer)")
+    cursor.execute("insert into table1 (name, value) values ('table1_1', 1)")
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+
+    return lambda: con.connect()
+
+
+def prepared_statements():
+    cursor = mro.connection.connection.cursor()
+    cursor.execute("select statement from pg_prepared_statements order by prepare_time")
+    statements = [row[0].split(' as ', 1)[1] for row in cursor]
+    mro.connection.connection.commit()
+    return statements
+
+
+def test_generated_statements_prepared(connection_function):
+    table = mro.table1.insert(name='table1_2', value=2)
+    mro.table1.insert(name='table1_3', value=3)
+    table.value = 4
+    table.update(value=5)
+    table.delete()
+    assert mro.table1.select_count() == 2
+
+    assert prepared_statements() == [
+        'insert into "table1" ("name", "value") values ($1, $2) returning "id"',
+        'update "table1" set "value" = $1 where "id" = $2',
+        'delete from "table1" where "id" = $1',
+        'select count(*) from "table1"']
+
+
+def test_user_clauses_not_prepared(connection_function):
+    # psycopg2 puts the values in as they are, prepared the value would be converted to an integer first
+    assert mro.table1.select_count("value > %s", 0.5) == 1
+    assert mro.table1.select_count("value > %s", 1.4) == 0
+    assert mro.table1.select_one("value > %s", 0.5).name == 'table1_1'
+
+    assert prepared_statements() == []
+
+
+def test_update_not_prepared(connection_function):
+    # the match values are compared as they are rather than converted to the column type, 1.5 doesn't match 2
+    mro.table1.insert(name='table1_2', value=2)
+    mro.table1.update(['value'], [1.5], name='changed')
+
+    assert mro.table1.select_count("name = %s", 'changed') == 0
+    assert prepared_statements() == ['insert into "table1" ("name", "value") values ($1, $2) returning "id"']
+
+
+def test_least_recently_used_deallocated(connection_function, monkeypatch):
+    monkeypatch.setattr(mro.table, 'PREPARED_STATEMENT_CACHE_SIZE', 2)
+
+    mro.table1.insert(name='table1_2')
+    mro.table1.select_count()
+    mro.table1.insert(name='table1_3')
+    mro.table1.insert(name='table1_4', value=4)
+
+    statements = prepared_statements()
+    assert len(statements) == 2
+    assert statements == ['insert into "table1" ("name") values ($1) returning "id"',
+                          'insert into "table1" ("name", "value") values ($1, $2) returning "id"']
+    assert mro.table1.select_count() == 4
+
+
+def test_prepared_again_after_reconnect(connection_function):
+    mro.table1.insert(name='table1_2')
+
+    mro.connection.connection.close()
+    mro.connection.reconnect()
+    assert prepared_statements() == []
+
+    table = mro.table1.insert(name='table1_3')
+    table.name = 'renamed'
+    assert mro.table1.get(table.id).name == 'renamed'
+    assert len(prepared_statements()) == 3
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
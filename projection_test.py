@@ -0,0 +1,161 @@
+import pytest
+import mro
+import connection as con
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, name varchar(20), payload text, data jsonb)")
+    cursor.execute("create table table2 (id serial primary key, table1_id integer references table1(id), name varchar(20), payload text)")
+    cursor.execute("create table table3 (name varchar(20), payload text)")
+    cursor.execute("insert into table1 (name, payload, data) values ('table1_1', 'payload 1', '{\"a\": 1}')")
+    cursor.execute("insert into table1 (name, payload, data) values ('table1_2', 'payload 2', '{\"a\": 2}')")
+    cursor.execute("insert into table2 (table1_id, name, payload) values (1, 'table2_1', 'payload 3')")
+    cursor.execute("insert into table2 (table1_id, name, payload) values (1, 'table2_2', 'payload 4')")
+    cursor.execute("insert into table3 (name, payload) values ('table3_1', 'payload 5')")
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+
+    return lambda: con.connect()
+
+
+def test_select_columns(connection_function):
+    tables = mro.table1.select("id = %s", 1, columns=['name'])
+
+    assert len(tables) == 1
+    table = tables[0]
+    assert table.__dict__ == {'id': 1, 'name': 'table1_1'}
+    assert table.name == 'table1_1'
+
+
+def test_missing_columns_loaded_on_use(connection_function):
+    table = mro.table1.select_one("id = %s", 2, columns='name')
+    assert 'payload' not in table.__dict__
+
+    assert table.payload == 'payload 2'
+    assert table.__dict__['data'] == '{"a": 2}'
+
+
+def test_update_partial_object(connection_function):
+    table = mro.table1.select_one("id = %s", 1, columns=['name'])
+    table.name = 'renamed'
+
+    assert 'payload' not in table.__dict__
+    table = mro.table1.select_one("id = %s", 1)
+    assert table.name == 'renamed'
+    assert table.payload == 'payload 1'
+
+
+def test_select_sql_only_has_columns(connection_function, monkeypatch):
+    statements = []
+    execute_sql = mro.table1._execute_sql
+
+    def record(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(mro.table1, '_execute_sql', record)
+    mro.table1.select(columns=['name'])
+
+    assert statements == ['select "id", "name" from "table1";']
+
+
+def test_foreign_key_reference_list_columns(connection_function):
+    table1 = mro.table1.select_one("id = %s", 1)
+    table1.table2s(columns=['name'])
+
+    assert sorted(table2.name for table2 in table1.table2s) == ['table2_1', 'table2_2']
+    assert all('payload' not in table2.__dict__ for table2 in table1.table2s)
+
+
+def test_foreign_key_reference_list_loaded_with_columns(connection_function, monkeypatch):
+    table1 = mro.table1.select_one("id = %s", 1)
+
+    statements = []
+    execute_sql = mro.table2._execute_sql
+
+    def record(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(mro.table2, '_execute_sql', record)
+    table2s = mro.table1.table2s.load(table1, columns=['name'])
+
+    assert table1.table2s is table2s
+    assert sorted(table2.name for table2 in table1.table2s) == ['table2_1', 'table2_2']
+    assert all('payload' not in table2.__dict__ for table2 in table1.table2s)
+    assert len(statements) == 1
+
+
+def test_deferred_columns_loaded_together(connection_function, monkeypatch):
+    tables = mro.table1.select(defer=['payload', 'data'])
+    assert all('payload' not in table.__dict__ for table in tables)
+
+    statements = []
+    execute_sql = mro.table1._execute_sql
+
+    def record(sql, *args, **kwargs):
+        statements.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    monkeypatch.setattr(mro.table1, '_execute_sql', record)
+
+    assert sorted(table.payload for table in tables) == ['payload 1', 'payload 2']
+    assert sorted(table.data for table in tables) == ['{"a": 1}', '{"a": 2}']
+    assert statements == ['select "id", "payload", "data" from "table1" where "id" = any(%s);']
+
+
+def test_deferred_column_set_before_load(connection_function):
+    tables = mro.table1.select(defer=['payload'])
+    tables[0].payload = 'changed'
+
+    assert tables[0].payload == 'changed'
+    assert tables[1].payload == f'payload {tables[1].id}'
+
+
+def test_class_deferred_columns(connection_function):
+    mro.table2.set_deferred_columns('payload')
+
+    table1 = mro.table1.select_one("id = %s", 1)
+    assert all('payload' not in table2.__dict__ for table2 in table1.table2s)
+    assert sorted(table2.payload for table2 in table1.table2s) == ['payload 3', 'payload 4']
+
+    assert 'payload' in mro.table2.select(defer=[])[0].__dict__
+    assert 'payload' not in mro.table2.select_page(limit=1)[0].__dict__
+
+
+def test_unknown_column(connection_function):
+    with pytest.raises(ValueError):
+        mro.table1.select(columns=['name', '1; drop table table1'])
+
+
+def test_columns_without_primary_key(connection_function):
+    # without a primary key the rest of the columns couldn't be loaded later
+    with pytest.raises(ValueError):
+        mro.table3.select(columns=['name'])
+    with pytest.raises(ValueError):
+        mro.table3.select_one(defer=['payload'])
+    with pytest.raises(ValueError):
+        mro.table3.set_deferred_columns('payload')
+    assert mro.table3._deferred_columns == []
+
+    assert mro.table3.select(columns=['name', 'payload'])[0].payload == 'payload 5'
+
+    # rows missing a column some other way say so rather than reading as null
+    table3 = mro.table3.select_one()
+    del table3.__dict__['payload']
+    with pytest.raises(AttributeError, match='payload'):
+        table3.payload
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,164 @@
+import time
+import pytest
+import mro
+import connection as con
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+
+    cursor.execute("create table table1 (id serial primary key, name varchar(20) not null, value integer)")
+    cursor.execute("insert into table1 (name, value) values ('table1_1', 1)")
+    cursor.execute("insert into table1 (name, value) values ('table1_2', 2)")
+    connection.commit()
+    connection.close()
+
+    mro.load_database(lambda: con.connect())
+
+    return lambda: con.connect()
+
+
+def change_outside_mro(sql):
+    connection = con.connect()
+    connection.cursor().execute(sql)
+    connection.commit()
+    connection.close()
+
+
+def test_cache_off_by_default(connection_function):
+    assert mro.table1.select_count() == 2
+    change_outside_mro("insert into table1 (name) values ('table1_3')")
+    assert mro.table1.select_count() == 3
+
+
+def test_cached_selects(connection_function):
+    mro.table1.enable_result_cache()
+
+    assert mro.table1.select_count() == 2
+    assert len(mro.table1.select()) == 2
+    assert mro.table1.select_one("id = %s", 1).name == 'table1_1'
+
+    change_outside_mro("update table1 set name = 'changed'")
+    change_outside_mro("insert into table1 (name) values ('table1_3')")
+
+    # writes that don't go through mro aren't seen until the entries expire
+    assert mro.table1.select_count() == 2
+    assert len(mro.table1.select()) == 2
+    assert mro.table1.select_one("id = %s", 1).name == 'table1_1'
+
+    # different arguments are different entries
+    assert mro.table1.select_count("name = %s", 'changed') == 2
+    assert mro.table1.select_one("id = %s", 2).name == 'changed'
+    assert mro.table1.select(as_='tuple')[0][1] == 'changed'
+
+    mro.table1.disable_result_cache()
+    assert mro.table1.select_count() == 3
+
+
+def test_select_returns_own_list(connection_function):
+    mro.table1.enable_result_cache()
+
+    tables = mro.table1.select()
+    tables.pop()
+
+    assert len(mro.table1.select()) == 2
+
+
+def test_dict_rows_copied(connection_function):
+    mro.table1.enable_result_cache()
+
+    mro.table1.select(as_='dict')[0]['name'] = 'changed'
+    mro.table1.select_one("id = %s", 1, as_='dict')['name'] = 'changed'
+
+    assert mro.table1.select(as_='dict')[0]['name'] == 'table1_1'
+    assert mro.table1.select_one("id = %s", 1, as_='dict')['name'] == 'table1_1'
+    assert mro.table1.select_one("id = %s", 3, as_='dict') is None
+
+
+def test_writes_clear_cache(connection_function):
+    mro.table1.enable_result_cache()
+
+    def check_cleared(write):
+        mro.table1.select_count()
+        assert len(mro.table1._result_cache) > 0
+        write()
+        assert len(mro.table1._result_cache) == 0
+
+    check_cleared(lambda: mro.table1.insert(name='table1_3'))
+    check_cleared(lambda: mro.table1.insert_many(['name'], [['table1_4'], ['table1_5']]))
+    check_cleared(lambda: mro.table1.update(['id'], [1], name='updated'))
+    check_cleared(lambda: mro.table1.delete("id = %s", 2))
+    assert mro.table1.select_count() == 4
+
+    table = mro.table1.select_one("id = %s", 1)
+    check_cleared(lambda: setattr(table, 'value', 10))
+    assert mro.table1.select_one("id = %s", 1).value == 10
+    check_cleared(lambda: table.update(name='again'))
+    check_cleared(lambda: table.delete())
+    assert mro.table1.select_one("id = %s", 1) is None
+
+
+def test_lru_size_limit(connection_function):
+    mro.table1.enable_result_cache(max_size=2)
+
+    mro.table1.select_count("id = %s", 1)
+    mro.table1.select_count("id = %s", 2)
+    mro.table1.select_count("id = %s", 1)
+    mro.table1.select_count("id = %s", 3)
+
+    assert len(mro.table1._result_cache) == 2
+    change_outside_mro("delete from table1")
+    # id 1 was used more recently than id 2 so is the one still cached
+    assert mro.table1.select_count("id = %s", 1) == 1
+    assert mro.table1.select_count("id = %s", 2) == 0
+
+
+def test_ttl(connection_function):
+    mro.table1.enable_result_cache(ttl=0.2)
+
+    assert mro.table1.select_count() == 2
+    change_outside_mro("delete from table1")
+    assert mro.table1.select_count() == 2
+    time.sleep(0.3)
+    assert mro.table1.select_count() == 0
+
+
+def test_read_started_before_write_not_cached(connection_function):
+    mro.table1.enable_result_cache()
+    cache = mro.table1._result_cache
+
+    generation = cache.generation
+    mro.table1.insert(name='table1_3')
+    cache.put('key', 'old result', generation)
+
+    assert cache.get('key') == (False, None)
+
+
+def test_unhashable_args(connection_function):
+    mro.table1.enable_result_cache()
+
+    # lists are cached as tuples
+    assert mro.table1.select_count("id = any(%s)", [1, 2]) == 2
+    assert len(mro.table1._result_cache) == 1
+
+    # other values which can't be hashed skip the cache
+    assert mro.table1.select_count("name::bytea = %s", bytearray(b'table1_1')) == 1
+    assert len(mro.table1._result_cache) == 1
+
+
+def test_identity_map_bypasses_cache(connection_function):
+    mro.table1.enable_result_cache()
+
+    table = mro.table1.select_one("id = %s", 1)
+    with mro.table.identity_map():
+        assert mro.table1.select_one("id = %s", 1) is not table
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,89 @@
+import os
+import pytest
+import mro
+import connection as con
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+    cursor.execute("DROP TYPE IF EXISTS custom_type")
+    cursor.execute("CREATE TYPE custom_type AS (custom_field_1 float, custom_field_2 int)")
+    cursor.execute("create table table1 (id serial primary key, column1 integer default 1, column2 varchar(20), column3 custom_type)")
+    cursor.execute("create table table2 (id serial primary key, table1_id integer references table1(id))")
+    cursor.execute("create function add_one(value integer) returns integer language sql as $$ select value + 1 $$")
+    cursor.execute("insert into table1 (column1, column2, column3) values (%s, %s, %s)", (1, 'Hello World!', (1.5, 2)))
+    cursor.execute("insert into table2 (table1_id) values (1)")
+    connection.commit()
+    connection.close()
+
+    return lambda: con.connect()
+
+
+def test_schema_cache_file_written(connection_function, tmp_path):
+    cache_file = str(tmp_path / 'schema.json')
+    mro.load_database(connection_function, schema_cache_file=cache_file)
+
+    assert os.path.isfile(cache_file)
+    assert mro.table1.select_one().column2 == 'Hello World!'
+
+
+def test_schema_loaded_from_cache(connection_function, tmp_path, monkeypatch):
+    cache_file = str(tmp_path / 'schema.json')
+    mro.load_database(connection_function, schema_cache_file=cache_file)
+
+    def fail(connection):
+        raise Exception('Schema should have come from the cache')
+
+    monkeypatch.setattr(mro, '_introspect_schema', fail)
+    mro.load_database(connection_function, schema_cache_file=cache_file)
+
+    table = mro.table1.select_one()
+    assert table.column1 == 1
+    assert table.column3.custom_field_2 == 2
+    assert isinstance(table.column3, mro.custom_types.custom_type)
+    assert isinstance(mro.table2.select_one().table1_id.object, mro.table1)
+    assert mro.add_one(1) == 2
+
+
+def test_schema_cache_invalidated_by_ddl(connection_function, tmp_path):
+    cache_file = str(tmp_path / 'schema.json')
+    mro.load_database(connection_function, schema_cache_file=cache_file)
+    mro.disconnect()
+
+    connection = con.connect()
+    cursor = connection.cursor()
+    cursor.execute("alter table table1 add column column4 integer default 4")
+    connection.commit()
+    connection.close()
+
+    mro.load_database(connection_function, schema_cache_file=cache_file)
+
+    assert mro.table1.select_one().column4 == 4
+
+
+def test_corrupt_schema_cache_ignored(connection_function, tmp_path):
+    cache_file = str(tmp_path / 'schema.json')
+    with open(cache_file, 'w') as f:
+        f.write('not json')
+
+    mro.load_database(connection_function, schema_cache_file=cache_file)
+
+    assert mro.table1.select_count() == 1
+
+
+def test_unwritable_schema_cache_ignored(connection_function, tmp_path):
+    cache_file = str(tmp_path / 'missing' / 'schema.json')
+    mro.load_database(connection_function, schema_cache_file=cache_file)
+
+    assert not os.path.exists(cache_file)
+    assert mro.table1.select_count() == 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
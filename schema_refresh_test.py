@@ -0,0 +1,169 @@
+import time
+import pytest
+import mro
+import mro.schema_refresh
+import connection as con
+
+
+def wait_for(condition, timeout=10):
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def run_ddl(*commands):
+    connection = con.connect()
+    cursor = connection.cursor()
+    for command in commands:
+        cursor.execute(command)
+    connection.commit()
+    connection.close()
+
+
+@pytest.fixture
+def connection_function(request):
+    connection = con.connect()
+    request.addfinalizer(mro.disconnect)
+
+    cursor = connection.cursor()
+
+    con.drop_tables()
+    cursor.execute("DROP TYPE IF EXISTS custom_type")
+    cursor.execute("create table table1 (id serial primary key, name varchar(20))")
+    cursor.execute("create table table2 (id serial primary key, table1_id integer references table1(id))")
+    cursor.execute("insert into table1 (name) values ('table1_1')")
+    cursor.execute("insert into table2 (table1_id) values (1)")
+    connection.commit()
+
+    mro.schema_refresh.install_event_trigger(connection)
+    connection.close()
+
+    def uninstall():
+        connection = con.connect()
+        mro.schema_refresh.uninstall_event_trigger(connection)
+        connection.close()
+    request.addfinalizer(uninstall)
+
+    return lambda: con.connect()
+
+
+def test_refresh_added_column(connection_function):
+    mro.load_database(connection_function, listen_for_schema_changes=True)
+    table2 = mro.table2
+
+    run_ddl("alter table table1 add column value integer default 5")
+
+    assert wait_for(lambda: 'value' in mro.table1.__dict__)
+    assert mro.table1.select_one().value == 5
+    # table2 refers to table1 so it is rebuilt to point at the new class
+    assert mro.table2 is not table2
+    assert isinstance(mro.table2.select_one().table1_id.object, mro.table1)
+
+
+def test_refresh_created_and_dropped_table(connection_function):
+    mro.load_database(connection_function, listen_for_schema_changes=True)
+
+    run_ddl("create table table3 (id serial primary key, table1_id integer references table1(id))")
+
+    assert wait_for(lambda: 'table3s' in mro.table1.__dict__)
+    assert 'table1_id' in mro.table3.__dict__
+    mro.table3(table1_id=1)
+    assert len(mro.table1.select_one().table3s) == 1
+
+    run_ddl("drop table table3")
+
+    assert wait_for(lambda: 'table3' not in mro.__dict__)
+    assert 'table3s' not in mro.table1.__dict__
+
+
+def test_refresh_routines(connection_function):
+    mro.load_database(connection_function, listen_for_schema_changes=True)
+
+    run_ddl("create function add_one(value integer) returns integer language sql as $$ select value + 1 $$")
+
+    assert wait_for(lambda: 'add_one' in mro.__dict__)
+    assert mro.add_one(1) == 2
+
+    run_ddl("drop function add_one")
+
+    assert wait_for(lambda: 'add_one' not in mro.__dict__)
+
+
+def test_refresh_custom_types(connection_function):
+    mro.load_database(connection_function, listen_for_schema_changes=True)
+
+    run_ddl("create type custom_type as (custom_field_1 integer, custom_field_2 integer)",
+            "alter table table1 add column value custom_type")
+
+    assert wait_for(lambda: 'value' in mro.table1.__dict__)
+    table = mro.table1.select_one()
+    table.value = {'custom_field_1': 3, 'custom_field_2': 4}
+    assert isinstance(mro.table1.select_one().value, mro.custom_types.custom_type)
+
+
+def test_refresh_lazy(connection_function):
+    mro.load_database(connection_function, lazy=True, listen_for_schema_changes=True)
+
+    run_ddl("alter table table1 add column value integer default 5")
+
+    assert wait_for(lambda: mro._lazy_tables['table1'] is not None)
+    assert 'table1' not in mro.__dict__
+    assert mro.table1.select_one().value == 5
+
+
+
+def test_refresh_waits_for_queries(connection_function):
+    mro.load_database(connection_function, listen_for_schema_changes=True)
+
+    # the classes aren't swapped while a query holds the shared connection
+    with mro.table.psycopg2_lock:
+        run_ddl("alter table table1 add column value integer default 5")
+        time.sleep(2)
+        assert 'value' not in mro.table1.__dict__
+
+    assert wait_for(lambda: 'value' in mro.table1.__dict__)
+
+
+def test_refresh_keeps_settings(connection_function):
+    mro.load_database(connection_function, listen_for_schema_changes=True)
+    mro.table1.set_deferred_columns('name')
+    mro.table1.enable_result_cache(max_size=10, ttl=30)
+
+    run_ddl("alter table table1 add column value integer default 5")
+
+    assert wait_for(lambda: 'value' in mro.table1.__dict__)
+    assert mro.table1._deferred_columns == ['name']
+    assert mro.table1._result_cache.max_size == 10
+    assert mro.table1._result_cache.ttl == 30
+    assert 'name' not in mro.table1.select_one().__dict__
+    assert mro.table2._result_cache is None
+
+
+def test_refresh_lazy_keeps_settings(connection_function):
+    mro.load_database(connection_function, lazy=True, listen_for_schema_changes=True)
+    mro.table1.set_deferred_columns('name')
+    mro.table1.enable_result_cache(max_size=10)
+
+    # changing a custom type reloads everything, so table1 is only built again when next used
+    run_ddl("create type custom_type as (custom_field_1 integer, custom_field_2 integer)")
+
+    assert wait_for(lambda: 'table1' not in mro.__dict__)
+    assert mro.table1._deferred_columns == ['name']
+    assert mro.table1._result_cache.max_size == 10
+
+
+def test_stop_listening_waits_for_listener(connection_function):
+    mro.load_database(connection_function, listen_for_schema_changes=True)
+    listener = mro.schema_refresh._listener
+
+    mro.load_database(connection_function)
+
+    assert not listener.is_alive()
+    assert mro.schema_refresh._listener is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])